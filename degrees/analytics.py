@@ -0,0 +1,252 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import sys
+from array import array
+from collections import Counter
+
+import degrees
+import snapshot
+
+# Number of BFS sources handed to a worker (and checkpointed) at a time
+CHUNK_SIZE = 32
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Graph-wide degree statistics for the degrees data."
+    )
+    parser.add_argument("directory", nargs="?", default="large")
+    parser.add_argument(
+        "--hub",
+        help="name or id of the person to compute Bacon numbers from "
+             "(default: the person with the most movies)"
+    )
+    parser.add_argument(
+        "--sources", type=int,
+        help="run BFS from this many randomly chosen people instead of everyone"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument(
+        "--checkpoint", metavar="FILE",
+        help="save progress to FILE and resume from it if it exists"
+    )
+    parser.add_argument("--output", metavar="FILE", help="write full results as JSON")
+    args = parser.parse_args()
+
+    print("Loading data...", file=sys.stderr)
+    degrees.load_data(args.directory, compact=True)
+    print("Data loaded.", file=sys.stderr)
+    graph = degrees.graph
+
+    if args.hub is None:
+        hub = max(
+            range(len(graph.person_ids)),
+            key=lambda person: len(graph.movies_of(person)),
+            default=None
+        )
+    else:
+        hub = resolve(args.hub)
+    if hub is None:
+        sys.exit(f"Person not found: {args.hub}")
+
+    labels, sizes = components(graph)
+    bacon = graph.distances(hub)
+
+    sources = list(range(len(graph.person_ids)))
+    if args.sources is not None and args.sources < len(sources):
+        sources = sorted(random.Random(args.seed).sample(sources, args.sources))
+    eccentricity, histogram = all_sources(
+        sources, args.workers, args.checkpoint,
+        dataset_key(args.directory, graph) if args.checkpoint else None
+    )
+
+    print(f"People: {len(graph.person_ids)}")
+    print(f"Connected components: {len(sizes)} (largest: {max(sizes, default=0)})")
+    print(f"Sources searched: {len(eccentricity)}")
+    print("Degrees of separation histogram:")
+    for distance in sorted(histogram):
+        print(f"  {distance}: {histogram[distance]}")
+    if eccentricity:
+        print(f"Diameter (over sources): {max(eccentricity.values())}")
+        # Isolated people have eccentricity 0 and would make the radius 0
+        connected = [value for value in eccentricity.values() if value > 0]
+        print(f"Radius (over connected sources): {min(connected, default=0)}")
+    hub_name = graph.person(hub).name
+    print(f"{hub_name} numbers:")
+    for number, count in sorted(Counter(d for d in bacon if d >= 0).items()):
+        print(f"  {number}: {count}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "components": sorted(sizes, reverse=True),
+                "histogram": {str(d): n for d, n in sorted(histogram.items())},
+                "eccentricity": {
+                    graph.person_ids[person]: value
+                    for person, value in sorted(eccentricity.items())
+                },
+                "hub": graph.person_ids[hub],
+                "bacon_numbers": {
+                    graph.person_ids[person]: distance
+                    for person, distance in enumerate(bacon) if distance >= 0
+                },
+                "component_of": {
+                    graph.person_ids[person]: label
+                    for person, label in enumerate(labels)
+                }
+            }, f)
+
+
+def resolve(name_or_id):
+    """
+    Return the person index for a person id or an unambiguous name.
+    """
+    graph = degrees.graph
+    if name_or_id in graph.person_index:
+        return graph.person_index[name_or_id]
+    person_ids = graph.names.get(name_or_id.lower(), set())
+    if len(person_ids) != 1:
+        return None
+    return graph.person_index[next(iter(person_ids))]
+
+
+def dataset_key(directory, graph):
+    """
+    Return a string identifying the data loaded from `directory`: the
+    hash of each source CSV and the size of the loaded graph.
+    """
+    hashes = {
+        filename: info["sha1"]
+        for filename, info in snapshot.source_info(directory).items()
+    }
+    return json.dumps({
+        "sources": hashes,
+        "people": len(graph.person_ids),
+        "movies": len(graph.movie_ids),
+        "credits": len(graph.person_movies)
+    }, sort_keys=True)
+
+
+def components(graph):
+    """
+    Label every person with a connected component number.
+    Return the label array and the list of component sizes.
+    """
+    labels = array("q", [-1]) * len(graph.person_ids)
+    seen_movies = bytearray(len(graph.movie_ids))
+    sizes = []
+    for start in range(len(graph.person_ids)):
+        if labels[start] >= 0:
+            continue
+        label = len(sizes)
+        labels[start] = label
+        stack = [start]
+        size = 1
+        while stack:
+            person = stack.pop()
+            for movie in graph.movies_of(person):
+                if seen_movies[movie]:
+                    continue
+                seen_movies[movie] = 1
+                for neighbor in graph.stars_of(movie):
+                    if labels[neighbor] < 0:
+                        labels[neighbor] = label
+                        size += 1
+                        stack.append(neighbor)
+        sizes.append(size)
+    return labels, sizes
+
+
+def eccentricities(chunk):
+    """
+    Run a BFS from every person in `chunk`, a (chunk number, sources) pair.
+    Return the chunk number, each source's eccentricity within its
+    component, and a histogram of distances to every reachable person.
+    """
+    number, sources = chunk
+    graph = degrees.graph
+    eccentricity = {}
+    histogram = Counter()
+    for source in sources:
+        counts = Counter(graph.distances(source))
+        counts.pop(-1, None)
+        counts.pop(0, None)
+        eccentricity[source] = max(counts, default=0)
+        histogram.update(counts)
+    return number, eccentricity, histogram
+
+
+def all_sources(sources, workers=1, checkpoint=None, dataset=None):
+    """
+    Compute eccentricities and the distance histogram over `sources`,
+    spreading chunks of sources across `workers` forked processes.
+
+    With a `checkpoint` file, finished chunks are saved after each one
+    completes and skipped when the same run is resumed. The checkpoint
+    is keyed by the sources and `dataset` (see dataset_key), so one
+    saved against other data is ignored.
+    """
+    chunks = [
+        (number, sources[i:i + CHUNK_SIZE])
+        for number, i in enumerate(range(0, len(sources), CHUNK_SIZE))
+    ]
+    digest = hashlib.sha1(array("q", sources).tobytes())
+    digest.update((dataset or "").encode("utf-8"))
+    key = digest.hexdigest()
+    state = {"key": key, "done": [], "eccentricity": {}, "histogram": {}}
+    if checkpoint and os.path.exists(checkpoint):
+        with open(checkpoint, encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("key") == key:
+            state = saved
+            print(f"Resuming: {len(state['done'])}/{len(chunks)} chunks done.",
+                  file=sys.stderr)
+
+    eccentricity = {int(k): v for k, v in state["eccentricity"].items()}
+    histogram = Counter({int(k): v for k, v in state["histogram"].items()})
+    done = set(state["done"])
+    pending = [chunk for chunk in chunks if chunk[0] not in done]
+
+    def record(result):
+        number, chunk_eccentricity, chunk_histogram = result
+        eccentricity.update(chunk_eccentricity)
+        histogram.update(chunk_histogram)
+        done.add(number)
+        if checkpoint:
+            save_checkpoint(checkpoint, {
+                "key": key,
+                "done": sorted(done),
+                "eccentricity": eccentricity,
+                "histogram": histogram
+            })
+        print(f"  {len(done)}/{len(chunks)} chunks", file=sys.stderr)
+
+    if workers > 1:
+        context = multiprocessing.get_context("fork")
+        with context.Pool(workers) as pool:
+            for result in pool.imap_unordered(eccentricities, pending):
+                record(result)
+    else:
+        for chunk in pending:
+            record(eccentricities(chunk))
+
+    return eccentricity, histogram
+
+
+def save_checkpoint(path, state):
+    """
+    Atomically replace the checkpoint file at `path` with `state`.
+    """
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Loads one representation in a fresh interpreter and reports its cost
+MEMORY_PROBE = """
+import json, resource, sys, time
+import degrees
+start = time.perf_counter()
+if sys.argv[2] == "dicts":
+    degrees.load_dicts(sys.argv[1])
+else:
+    degrees.load_data(sys.argv[1], compact=sys.argv[2] == "compact", cache=False)
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "seconds": elapsed,
+    "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+}))
+"""
+
+BASELINE_PROBE = """
+import json, resource
+import degrees
+print(json.dumps({
+    "seconds": 0.0,
+    "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for degrees.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    memory = subparsers.add_parser(
+        "memory", help="compare peak RSS of the dict and compact representations"
+    )
+    memory.add_argument("directory")
+
+    search = subparsers.add_parser(
+        "alt", help="compare ALT and bidirectional BFS expansions on random pairs"
+    )
+    search.add_argument("directory")
+    search.add_argument("--landmarks", type=int, default=16, help="number of landmarks to choose")
+    search.add_argument(
+        "--landmark-people", nargs="+", metavar="PERSON",
+        help="names or ids of the people to use as landmarks instead"
+    )
+    search.add_argument("--queries", type=int, default=200)
+    search.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.command == "memory":
+        benchmark_memory(os.path.abspath(args.directory))
+    elif args.command == "alt":
+        benchmark_alt(
+            args.directory, args.landmarks, args.queries, args.seed, args.landmark_people
+        )
+
+
+def probe(code, *args):
+    """
+    Run `code` in a fresh interpreter inside the degrees directory and
+    return the JSON object it prints.
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", code, *args],
+        cwd=HERE, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def benchmark_memory(directory):
+    """
+    Load `directory` once per representation, each in its own process so
+    peak RSS is not shared, and print the results: the dictionaries
+    alone, the dictionaries with the graph built from them (what
+    load_data does by default), and the compact graph alone.
+    """
+    baseline = probe(BASELINE_PROBE)
+    print(f"{'representation':<16}{'load (s)':>10}{'peak RSS (MB)':>16}{'over baseline (MB)':>20}")
+    for representation in ["dicts", "dicts+graph", "compact"]:
+        result = probe(MEMORY_PROBE, directory, representation)
+        peak = result["peak_rss_kb"] / 1024
+        extra = (result["peak_rss_kb"] - baseline["peak_rss_kb"]) / 1024
+        print(f"{representation:<16}{result['seconds']:>10.2f}{peak:>16.1f}{extra:>20.1f}")
+
+
+def benchmark_alt(directory, count, queries, seed, people=None):
+    """
+    Answer the same random connected pairs with bidirectional BFS and
+    with ALT search, checking that path lengths agree, and print the
+    mean number of people expanded and time per query for each.
+
+    ALT uses `count` chosen landmarks, or the `people` (names or ids)
+    given.
+    """
+    import analytics
+    import degrees
+    import landmarks
+
+    degrees.load_data(directory, compact=True)
+    graph = degrees.graph
+    if people is not None:
+        indices = [analytics.resolve(person) for person in people]
+        for person, index in zip(people, indices):
+            if index is None:
+                sys.exit(f"Person not found or ambiguous: {person}")
+        people = indices
+    start = time.perf_counter()
+    chosen = landmarks.load_or_build(directory, graph, count, people)
+    print(f"Landmarks ready in {time.perf_counter() - start:.2f}s")
+
+    rng = random.Random(seed)
+    pairs = []
+    while len(pairs) < queries:
+        source = rng.randrange(len(graph.person_ids))
+        target = rng.randrange(len(graph.person_ids))
+        if graph.shortest_path(source, target) is not None:
+            pairs.append((source, target))
+
+    results = {}
+    lengths = {}
+    for name, search in [
+        ("bidirectional", graph.shortest_path),
+        ("alt", lambda s, t: chosen.shortest_path(graph, s, t))
+    ]:
+        expansions = 0
+        start = time.perf_counter()
+        lengths[name] = []
+        for source, target in pairs:
+            lengths[name].append(len(search(source, target)))
+            expansions += graph.expansions
+        elapsed = time.perf_counter() - start
+        results[name] = (expansions / queries, 1000 * elapsed / queries)
+
+    if lengths["alt"] != lengths["bidirectional"]:
+        sys.exit("ALT and bidirectional BFS disagree on path lengths.")
+    print(f"{'search':<16}{'expanded/query':>16}{'ms/query':>12}")
+    for name, (expansions, milliseconds) in results.items():
+        print(f"{name:<16}{expansions:>16.1f}{milliseconds:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
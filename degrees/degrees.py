@@ -1,7 +1,18 @@
+import argparse
 import csv
+import functools
+import json
+import multiprocessing
+import os
 import sys
+import threading
+import time
 
-# from .util import Node, StackFrontier, QueueFrontier
+import ingest
+import landmarks as alt
+import snapshot
+from fuzzy import NameIndex
+from graph import Graph
 
 # Maps names to a set of corresponding person_ids
 names = {}
@@ -12,10 +23,78 @@ people = {}
 # Maps movie_ids to a dictionary of: title, year, stars (a set of person_ids)
 movies = {}
 
+# Integer-indexed adjacency over people and movies, built by load_data
+graph = None
 
-def load_data(directory):
+# Landmark distances for ALT search, set by load_landmarks
+landmarks = None
+
+# Prefix/trigram index for fuzzy name lookups, built by load_name_index
+name_index = None
+
+# Ways person_id_for_name can settle a name shared by several people
+POLICIES = ["prompt", "most_connected", "strict"]
+
+# Byte offset up to which each CSV has been read into the graph
+offsets = {}
+
+# Held while the graph is being searched or updated
+graph_lock = threading.Lock()
+
+
+def load_data(directory, compact=False, cache=True, streaming=False):
     """
     Load data from CSV files into memory.
+
+    A compiled snapshot of the data is kept next to the CSVs and
+    memory-mapped instead when it is still up to date; otherwise the
+    CSVs are parsed and the snapshot is rewritten. Pass `cache=False`
+    to neither read nor write the snapshot.
+
+    By default the `names`, `people` and `movies` dictionaries are filled
+    in as well, from the CSVs or, when the snapshot is used, from the
+    graph. With `compact`, the CSVs are loaded straight into the graph
+    and the dictionaries are left empty.
+
+    With `streaming`, a missing or stale snapshot is rebuilt on disk in
+    bounded memory (see ingest.py) and then memory-mapped, so datasets
+    larger than RAM can be loaded.
+    """
+    global graph
+
+    for filename in snapshot.SOURCES:
+        offsets[filename] = os.path.getsize(os.path.join(directory, filename))
+
+    if cache:
+        graph = snapshot.load(directory)
+        if graph is not None:
+            if not compact:
+                fill_dicts()
+            return
+
+    if streaming:
+        ingest.build(directory)
+        graph = snapshot.load(directory)
+        if not compact:
+            fill_dicts()
+        return
+
+    if compact:
+        graph = Graph.from_csv(directory)
+        if cache:
+            save_snapshot(directory)
+        return
+
+    load_dicts(directory)
+    graph = Graph.from_dicts(people, movies, names)
+    if cache:
+        save_snapshot(directory)
+
+
+def load_dicts(directory):
+    """
+    Fill in the `names`, `people` and `movies` dictionaries from the CSV
+    files in `directory`, without building the graph.
     """
     # Load people
     with open(f"{directory}/people.csv", encoding="utf-8") as f:
@@ -52,20 +131,221 @@ def load_data(directory):
                 pass
 
 
+def fill_dicts():
+    """
+    Fill in the `names`, `people` and `movies` dictionaries from the
+    loaded graph, for callers that read them directly.
+    """
+    for person, person_id in enumerate(graph.person_ids):
+        people[person_id] = {
+            "name": graph.person_names[person],
+            "birth": graph.person_births[person],
+            "movies": {graph.movie_ids[movie] for movie in graph.movies_of(person)}
+        }
+        names.setdefault(graph.person_names[person].lower(), set()).add(person_id)
+    for movie, movie_id in enumerate(graph.movie_ids):
+        movies[movie_id] = {
+            "title": graph.movie_titles[movie],
+            "year": graph.movie_years[movie],
+            "stars": {graph.person_ids[person] for person in graph.stars_of(movie)}
+        }
+
+
+def save_snapshot(directory):
+    """
+    Write the loaded graph's snapshot for `directory`, if possible.
+    """
+    try:
+        snapshot.save(directory, graph)
+    except OSError:
+        pass
+
+
+def add_person(person_id, name, birth):
+    """
+    Add a person to the loaded data without reloading it.
+    """
+    if person_id in graph.person_index:
+        return
+    person = graph.add_person(person_id, name, birth)
+    if people:
+        people[person_id] = {"name": name, "birth": birth, "movies": set()}
+        # A graph built from the dicts shares `names` and has updated it
+        if graph.names is not names:
+            names.setdefault(name.lower(), set()).add(person_id)
+    if landmarks is not None:
+        landmarks.grow(graph)
+    if name_index is not None:
+        name_index.add(person)
+
+
+def add_movie(movie_id, title, year):
+    """
+    Add a movie to the loaded data without reloading it.
+    """
+    if movie_id in graph.movie_index:
+        return
+    graph.add_movie(movie_id, title, year)
+    if people:
+        movies[movie_id] = {"title": title, "year": year, "stars": set()}
+
+
+def add_star(person_id, movie_id):
+    """
+    Record that a known person starred in a known movie.
+    Returns True if this was a new credit.
+
+    Cached co-star lists and landmark distances are patched for the
+    people the new credit connects rather than recomputed.
+    """
+    try:
+        person = graph.person_index[person_id]
+        movie = graph.movie_index[movie_id]
+    except KeyError:
+        return False
+    stars = graph.add_star(person, movie)
+    if stars is None:
+        return False
+    if people:
+        people[person_id]["movies"].add(movie_id)
+        movies[movie_id]["stars"].add(person_id)
+    if landmarks is not None:
+        landmarks.add_star(graph, person, stars)
+    if name_index is not None:
+        name_index.touch(person)
+    return True
+
+
+def read_appended(directory):
+    """
+    Apply rows appended to the CSVs in `directory` since they were last
+    read, people and movies before stars. A trailing partial line is
+    left for the next call. Returns the number of rows applied per file.
+    """
+    applied = {}
+    for filename, add in [
+        ("people.csv", lambda row: add_person(row["id"], row["name"], row["birth"])),
+        ("movies.csv", lambda row: add_movie(row["id"], row["title"], row["year"])),
+        ("stars.csv", lambda row: add_star(row["person_id"], row["movie_id"]))
+    ]:
+        path = os.path.join(directory, filename)
+        with open(path, "rb") as f:
+            header = next(csv.reader([f.readline().decode("utf-8")]))
+            f.seek(offsets.get(filename, 0))
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        if not end:
+            applied[filename] = 0
+            continue
+        offsets[filename] = offsets.get(filename, 0) + end
+        rows = list(csv.DictReader(
+            data[:end].decode("utf-8").splitlines(), fieldnames=header
+        ))
+        with graph_lock:
+            for row in rows:
+                add(row)
+        applied[filename] = len(rows)
+    return applied
+
+
+def follow(directory, interval=1.0, stop=None):
+    """
+    Keep applying rows appended to the CSVs in `directory`, polling
+    every `interval` seconds until the `stop` event (if any) is set.
+    """
+    while stop is None or not stop.is_set():
+        applied = read_appended(directory)
+        if any(applied.values()):
+            print(f"Applied {applied}", file=sys.stderr)
+        time.sleep(interval)
+
+
+def load_landmarks(directory, count=alt.DEFAULT_COUNT, people=None, cache=True):
+    """
+    Load (or compute and cache) landmark distances for the loaded graph,
+    after which shortest_path uses ALT search instead of plain BFS.
+    `people`, if given, lists the landmark person ids to use instead of
+    choosing `count` of them.
+
+    This is an experiment, not offered by the command line: on the
+    small-world IMDB graph ALT expands more people than bidirectional
+    BFS and is slower per query (see `benchmark.py alt`).
+    """
+    global landmarks
+
+    if people is not None:
+        people = [graph.person_index[person_id] for person_id in people]
+    landmarks = alt.load_or_build(directory, graph, count, people, cache=cache)
+
+
+def load_name_index():
+    """
+    Build the prefix/trigram name index over the loaded graph.
+    """
+    global name_index
+
+    name_index = NameIndex(graph)
+
+
 def main():
-    if len(sys.argv) > 2:
-        sys.exit("Usage: python degrees.py [directory]")
-    directory = sys.argv[1] if len(sys.argv) == 2 else "large"
+    parser = argparse.ArgumentParser(
+        description="Find the degrees of separation between two actors."
+    )
+    parser.add_argument("directory", nargs="?", default="large")
+    parser.add_argument(
+        "--batch", metavar="FILE",
+        help="answer JSON-lines queries from FILE ('-' for stdin)"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="number of processes answering batch queries"
+    )
+    parser.add_argument(
+        "--resolve", choices=POLICIES,
+        help="how to pick among people sharing a name "
+             "(default: prompt, or strict in batch mode)"
+    )
+    parser.add_argument(
+        "--fuzzy", action="store_true",
+        help="fall back to the closest name when there is no exact match"
+    )
+    parser.add_argument(
+        "--streaming", action="store_true",
+        help="build the snapshot in bounded memory instead of loading the CSVs"
+    )
+    parser.add_argument(
+        "--follow", type=float, metavar="SECONDS",
+        help="in batch mode, poll the CSVs for appended rows every SECONDS"
+    )
+    args = parser.parse_args()
+    if args.follow and args.workers > 1:
+        parser.error("--follow requires a single worker")
+    policy = args.resolve or ("strict" if args.batch else "prompt")
 
     # Load data from files into memory
-    print("Loading data...")
-    load_data(directory)
-    print("Data loaded.")
+    log = sys.stderr if args.batch else sys.stdout
+    print("Loading data...", file=log)
+    load_data(args.directory, compact=True, streaming=args.streaming)
+    if args.fuzzy:
+        load_name_index()
+    print("Data loaded.", file=log)
+
+    if args.batch:
+        if args.follow:
+            threading.Thread(
+                target=follow, args=(args.directory, args.follow), daemon=True
+            ).start()
+        if args.batch == "-":
+            run_batch(sys.stdin, sys.stdout, args.workers, policy, args.fuzzy)
+        else:
+            with open(args.batch, encoding="utf-8") as f:
+                run_batch(f, sys.stdout, args.workers, policy, args.fuzzy)
+        return
 
-    source = person_id_for_name(input("Name: "))
+    source = person_id_for_name(input("Name: "), policy, args.fuzzy)
     if source is None:
         sys.exit("Person not found.")
-    target = person_id_for_name(input("Name: "))
+    target = person_id_for_name(input("Name: "), policy, args.fuzzy)
     if target is None:
         sys.exit("Person not found.")
 
@@ -78,9 +358,9 @@ def main():
         print(f"{degrees} degrees of separation.")
         path = [(None, source)] + path
         for i in range(degrees):
-            person1 = people[path[i][1]]["name"]
-            person2 = people[path[i + 1][1]]["name"]
-            movie = movies[path[i + 1][0]]["title"]
+            person1 = graph.person(graph.person_index[path[i][1]]).name
+            person2 = graph.person(graph.person_index[path[i + 1][1]]).name
+            movie = graph.movie(graph.movie_index[path[i + 1][0]]).title
             print(f"{i + 1}: {person1} and {person2} starred in {movie}")
 
 
@@ -91,56 +371,153 @@ def shortest_path(source, target):
 
     If no possible path, returns None.
     """
+    source = graph.person_index[source]
+    target = graph.person_index[target]
+    if landmarks is not None:
+        path = landmarks.shortest_path(graph, source, target)
+    else:
+        path = graph.shortest_path(source, target)
+    if path is None:
+        return None
+    return [
+        (graph.movie_ids[movie], graph.person_ids[person])
+        for movie, person in path
+    ]
 
-    # TODO
-    frontier = list(neighbors_for_person(source))
-    explored_set = []
-    for (movie_id, person_id) in frontier:
-        if person_id == source or checkid(person_id, explored_set):
-            continue
-        elif person_id == target:
-            explored_set.append((movie_id, person_id))
-            if len(explored_set) < 6:
-                return explored_set
-            else:
-                frontier = frontier + explored_set
-                explored_set.clear()
-                continue
-        elif (movie_id, person_id) in explored_set:
-            continue
-        else:
-            explored_set.append((movie_id, person_id))
-            temp = list(neighbors_for_person(person_id))
-            for (x, y) in temp:
-                if y == target:
-                    explored_set.append((x, y))
-                    if len(explored_set) < 6:
-                        return explored_set
-                    else:
-                        frontier = frontier + explored_set
-                        explored_set.clear()
-                        continue
-                else:
-                    frontier.append((x, y))
 
+def run_batch(lines, out, workers=1, policy="strict", fuzzy=False):
+    """
+    Answer every JSON-lines query in `lines` against the loaded graph,
+    writing one JSON result per line to `out` as soon as it is ready.
+    Names are resolved with `policy` and `fuzzy` as in person_id_for_name,
+    except that "prompt" is treated as "strict".
+
+    With more than one worker, queries are spread over a forked process
+    pool; the workers share the already-loaded graph copy-on-write, and
+    results stream back in completion order (each carries its `line`).
+    """
+    queries = enumerate(lines, 1)
+    answer = functools.partial(answer_line, policy=policy, fuzzy=fuzzy)
+    if workers > 1:
+        context = multiprocessing.get_context("fork")
+        with context.Pool(workers) as pool:
+            for result in pool.imap_unordered(answer, queries, chunksize=16):
+                print(result, file=out, flush=True)
     else:
-        return None
+        for query in queries:
+            with graph_lock:
+                result = answer(query)
+            print(result, file=out, flush=True)
+
+
+def answer_line(numbered_line, policy="strict", fuzzy=False):
+    """
+    Answer one (line number, JSON text) batch query and return the
+    JSON-encoded result. Blank lines yield an empty result, and a query
+    that fails yields an "error" result rather than ending the batch.
+    """
+    number, line = numbered_line
+    if not line.strip():
+        return json.dumps({"line": number})
+    try:
+        query = json.loads(line)
+    except ValueError:
+        query = None
+    if not isinstance(query, dict):
+        return json.dumps({"line": number, "error": "Invalid query."})
+    try:
+        result = answer_query(query, policy, fuzzy)
+    except Exception as error:
+        result = {"id": query.get("id")} if "id" in query else {}
+        result["error"] = f"Query failed: {error}"
+    result["line"] = number
+    return json.dumps(result)
+
+
+def answer_query(query, policy="strict", fuzzy=False):
+    """
+    Answer a batch query: a dictionary naming a "source" and "target"
+    person (or giving "source_id" and "target_id" directly, as strings
+    or numbers), plus an optional "id" echoed back.
+
+    Returns a dictionary with the degrees of separation and the path,
+    or an "error" message. Never prompts for input.
+    """
+    if policy == "prompt":
+        policy = "strict"
+    result = {"id": query.get("id")} if "id" in query else {}
+    ends = []
+    for end in ("source", "target"):
+        person_id = query.get(f"{end}_id")
+        if person_id is not None:
+            person_id = str(person_id)
+        if person_id is None:
+            name = str(query.get(end, ""))
+            person_id = person_id_for_name(name, policy, fuzzy)
+            if person_id is None:
+                person_ids = graph.names.get(name.lower(), set())
+                result["error"] = (
+                    f"Ambiguous {end}: {sorted(person_ids)}" if person_ids
+                    else f"Person not found: {name}"
+                )
+                return result
+        elif person_id not in graph.person_index:
+            result["error"] = f"Person not found: {person_id}"
+            return result
+        ends.append(person_id)
+
+    source, target = ends
+    result["source_id"], result["target_id"] = source, target
+    path = shortest_path(source, target)
+    if path is None:
+        result["degrees"] = None
+        return result
+
+    result["degrees"] = len(path)
+    result["path"] = [
+        {
+            "movie_id": movie_id,
+            "title": graph.movie(graph.movie_index[movie_id]).title,
+            "person_id": person_id,
+            "name": graph.person(graph.person_index[person_id]).name
+        }
+        for movie_id, person_id in path
+    ]
+    return result
 
 
-def person_id_for_name(name):
+def person_id_for_name(name, policy="prompt", fuzzy=False):
     """
     Returns the IMDB id for a person's name,
     resolving ambiguities as needed.
+
+    `policy` decides between people sharing the name: "prompt" asks on
+    stdin, "most_connected" picks whoever starred in the most movies,
+    and "strict" gives up. With `fuzzy`, a name with no exact match
+    resolves to the best-scoring candidate from candidates_for_name.
     """
-    person_ids = list(names.get(name.lower(), set()))
+    person_ids = list(graph.names.get(name.lower(), set()))
+    if len(person_ids) == 0 and fuzzy:
+        candidates = candidates_for_name(name)
+        if candidates:
+            best = candidates[0][2]
+            person_ids = [
+                person_id for person_id, _, score in candidates if score == best
+            ]
     if len(person_ids) == 0:
         return None
+    elif len(person_ids) > 1 and policy == "most_connected":
+        return max(person_ids, key=lambda person_id: (
+            len(graph.movies_of(graph.person_index[person_id])), person_id
+        ))
+    elif len(person_ids) > 1 and policy == "strict":
+        return None
     elif len(person_ids) > 1:
         print(f"Which '{name}'?")
         for person_id in person_ids:
-            person = people[person_id]
-            name = person["name"]
-            birth = person["birth"]
+            person = graph.person(graph.person_index[person_id])
+            name = person.name
+            birth = person.birth
             print(f"ID: {person_id}, Name: {name}, Birth: {birth}")
         try:
             person_id = input("Intended Person ID: ")
@@ -153,28 +530,41 @@ def person_id_for_name(name):
         return person_ids[0]
 
 
-def neighbors_for_person(person_id):
+def candidates_for_name(name, limit=10):
+    """
+    Returns up to `limit` (person_id, name, score) triples for people
+    whose names best match `name`, highest score first, building the
+    name index on first use.
+    """
+    if name_index is None:
+        load_name_index()
+    return [
+        (graph.person_ids[person], graph.person_names[person], score)
+        for person, score in name_index.candidates(name, limit)
+    ]
+
+
+def neighbors_for_person(person_id, distinct=False):
     """
     Returns (movie_id, person_id) pairs for people
     who starred with a given person.
+
+    With `distinct`, returns one pair per co-star (with a single witness
+    movie) from the graph's co-star projection or LRU cache; hit and miss
+    counts are available from `graph.costar_cache.info()`.
     """
-    movie_ids = people[person_id]["movies"]
+    if distinct:
+        return {
+            (graph.movie_ids[movie], graph.person_ids[person])
+            for movie, person in graph.costars(graph.person_index[person_id])
+        }
+
     neighbors = set()
-    for movie_id in movie_ids:
-        for person_id in movies[movie_id]["stars"]:
-            neighbors.add((movie_id, person_id))
+    for movie in graph.movies_of(graph.person_index[person_id]):
+        for person in graph.stars_of(movie):
+            neighbors.add((graph.movie_ids[movie], graph.person_ids[person]))
     return neighbors
 
-def checkid(person_id, explore):
-    """
-    Returns True if the personid is the list provided. Else returns False.
-
-    """
-    for (x, y) in explore:
-        if y == person_id:
-            return True
-        else:
-            return False
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,157 @@
+import bisect
+from array import array
+from collections import Counter
+
+# Query trigrams whose posting lists are scanned, rarest first
+SCANNED_TRIGRAMS = 4
+
+# Upper bound on posting entries scanned per lookup
+MAX_POSTINGS = 20000
+
+# Candidates scoring below this are not returned
+MIN_SCORE = 0.3
+
+
+def trigrams(name):
+    """
+    Return the set of character trigrams of lowercase `name`, padded so
+    that the start and end of the name form trigrams of their own.
+    """
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex():
+
+    def __init__(self, graph):
+        """
+        Build prefix and trigram indexes over the names of every person
+        in `graph`.
+
+        Distinct lowercase names are numbered, `order` lists them sorted
+        (for prefix search) and each trigram maps to an array of the
+        names containing it. Each name maps to the person indices sharing
+        it, most-connected first.
+        """
+        self.graph = graph
+        people = {}
+        for person, name in enumerate(graph.person_names):
+            people.setdefault(name.lower(), []).append(person)
+        self.keys = sorted(people)
+        self.key_index = {key: i for i, key in enumerate(self.keys)}
+        self.order = list(range(len(self.keys)))
+        self.people = [people[key] for key in self.keys]
+        for i in range(len(self.keys)):
+            self._rank(i)
+
+        # Name positions whose people may be out of order since the last
+        # query, re-sorted lazily
+        self.stale = set()
+
+        postings = {}
+        for i, key in enumerate(self.keys):
+            for trigram in trigrams(key):
+                posting = postings.get(trigram)
+                if posting is None:
+                    posting = postings[trigram] = array("i")
+                posting.append(i)
+        self.postings = postings
+
+    def _rank(self, i):
+        """
+        Sort the people sharing name position `i` most-connected first.
+        """
+        self.people[i].sort(key=lambda p: -len(self.graph.movies_of(p)))
+
+    def add(self, person):
+        """
+        Index person `person`, appended to the graph after the index was
+        built.
+        """
+        key = self.graph.person_names[person].lower()
+        i = self.key_index.get(key)
+        if i is not None:
+            self.people[i].append(person)
+            self.stale.add(i)
+            return
+        i = len(self.keys)
+        self.keys.append(key)
+        self.key_index[key] = i
+        self.people.append([person])
+        bisect.insort(self.order, i, key=self.keys.__getitem__)
+        for trigram in trigrams(key):
+            self.postings.setdefault(trigram, array("i")).append(i)
+
+    def touch(self, person):
+        """
+        Note that person `person` gained a movie, which may change their
+        place among the people sharing their name.
+        """
+        i = self.key_index.get(self.graph.person_names[person].lower())
+        if i is not None and len(self.people[i]) > 1:
+            self.stale.add(i)
+
+    def _prefixed(self, prefix, limit):
+        """
+        Return up to `limit` name positions that start with `prefix`.
+        """
+        start = bisect.bisect_left(self.order, prefix, key=self.keys.__getitem__)
+        found = []
+        for i in self.order[start:start + limit]:
+            if not self.keys[i].startswith(prefix):
+                break
+            found.append(i)
+        return found
+
+    def candidates(self, name, limit=10):
+        """
+        Return up to `limit` (person, score) pairs for people whose name
+        best matches `name`, highest score first.
+
+        An exact match scores 1. Names starting with the query score
+        between 0.5 and 1 by how much of the name the query covers, and
+        other names score the Jaccard similarity of their trigram sets.
+        Only names sharing one of the query's rarest trigrams are scored,
+        and at most MAX_POSTINGS index entries are read, which keeps
+        lookups fast. People with the same name are ordered
+        by number of movies.
+        """
+        query = " ".join(name.lower().split())
+        if not query:
+            return []
+
+        scores = {}
+        for i in self._prefixed(query, limit):
+            scores[i] = 0.5 + 0.5 * len(query) / len(self.keys[i])
+
+        query_trigrams = trigrams(query)
+        present = sorted(
+            (len(self.postings[t]), t) for t in query_trigrams if t in self.postings
+        )
+        shared = Counter()
+        budget = MAX_POSTINGS
+        for _, trigram in present[:SCANNED_TRIGRAMS]:
+            if budget <= 0:
+                break
+            posting = self.postings[trigram]
+            shared.update(posting[:budget])
+            budget -= len(posting)
+        for i, _ in shared.most_common(10 * limit):
+            if i in scores:
+                continue
+            key_trigrams = trigrams(self.keys[i])
+            score = len(query_trigrams & key_trigrams) / len(query_trigrams | key_trigrams)
+            if score >= MIN_SCORE:
+                scores[i] = score
+
+        for i in self.stale:
+            self._rank(i)
+        self.stale.clear()
+
+        ranked = []
+        for i, score in sorted(scores.items(), key=lambda item: -item[1]):
+            for person in self.people[i]:
+                ranked.append((person, score))
+                if len(ranked) == limit:
+                    return ranked
+        return ranked
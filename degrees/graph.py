@@ -0,0 +1,642 @@
+import bisect
+import csv
+import itertools
+from array import array
+from collections import OrderedDict
+
+# Number of people whose co-star lists are kept by the LRU cache
+COSTAR_CACHE_SIZE = 65536
+
+
+class Person():
+    __slots__ = ("id", "name", "birth")
+
+    def __init__(self, id, name, birth):
+        self.id = id
+        self.name = name
+        self.birth = birth
+
+
+class Movie():
+    __slots__ = ("id", "title", "year")
+
+    def __init__(self, id, title, year):
+        self.id = id
+        self.title = title
+        self.year = year
+
+
+class Graph():
+
+    def __init__(self, person_ids, movie_ids,
+                 person_offsets, person_movies,
+                 movie_offsets, movie_people,
+                 person_names=(), person_births=(),
+                 movie_titles=(), movie_years=(),
+                 person_index=None, movie_index=None, names=None):
+        """
+        Initialize an integer-indexed person/movie graph.
+
+        People and movies are numbered 0..n-1. Adjacency is stored in
+        compressed sparse row (CSR) form:
+            - the movies of person `p` are
+              `person_movies[person_offsets[p]:person_offsets[p + 1]]`
+            - the stars of movie `m` are
+              `movie_people[movie_offsets[m]:movie_offsets[m + 1]]`
+        `person_ids` and `movie_ids` map indices back to the IMDB ids, and
+        the other sequences hold each person's name and birth and each
+        movie's title and year by index.
+
+        `person_index` and `movie_index` map IMDB ids to indices and
+        `names` maps a lowercase name to a set of person ids. The id
+        indexes are built here when not supplied.
+        """
+        self.person_ids = person_ids
+        self.movie_ids = movie_ids
+        self.person_offsets = person_offsets
+        self.person_movies = person_movies
+        self.movie_offsets = movie_offsets
+        self.movie_people = movie_people
+        self.person_names = person_names
+        self.person_births = person_births
+        self.movie_titles = movie_titles
+        self.movie_years = movie_years
+        if person_index is None:
+            person_index = {
+                person_id: i for i, person_id in enumerate(person_ids)
+            }
+        if movie_index is None:
+            movie_index = {
+                movie_id: i for i, movie_id in enumerate(movie_ids)
+            }
+        self.person_index = person_index
+        self.movie_index = movie_index
+        self.names = names if names is not None else {}
+        self.projection = None
+        self.projection_added = {}
+        self.expansions = 0
+
+        # Edges appended after loading, layered over the CSR arrays
+        self.added_movies = {}
+        self.added_stars = {}
+        self.costar_cache = LRUCache(COSTAR_CACHE_SIZE)
+
+    @classmethod
+    def from_dicts(cls, people, movies, names=None):
+        """
+        Graph.from_dicts(people, movies, names) builds a graph from the
+        `people`, `movies` and `names` dictionaries filled in by `load_data`.
+        """
+        person_ids = list(people)
+        movie_ids = list(movies)
+        person_index = {person_id: i for i, person_id in enumerate(person_ids)}
+        movie_index = {movie_id: i for i, movie_id in enumerate(movie_ids)}
+
+        person_offsets = array("q", [0])
+        person_movies = array("q")
+        for person_id in person_ids:
+            person_movies.extend(
+                movie_index[movie_id] for movie_id in people[person_id]["movies"]
+            )
+            person_offsets.append(len(person_movies))
+
+        movie_offsets = array("q", [0])
+        movie_people = array("q")
+        for movie_id in movie_ids:
+            movie_people.extend(
+                person_index[person_id] for person_id in movies[movie_id]["stars"]
+            )
+            movie_offsets.append(len(movie_people))
+
+        return cls(person_ids, movie_ids,
+                   person_offsets, person_movies,
+                   movie_offsets, movie_people,
+                   person_names=[people[i]["name"] for i in person_ids],
+                   person_births=[people[i]["birth"] for i in person_ids],
+                   movie_titles=[movies[i]["title"] for i in movie_ids],
+                   movie_years=[movies[i]["year"] for i in movie_ids],
+                   person_index=person_index, movie_index=movie_index,
+                   names=names)
+
+    @classmethod
+    def from_csv(cls, directory):
+        """
+        Graph.from_csv(directory) builds a graph straight from the CSVs
+        in `directory` without the nested `people`/`movies` dictionaries.
+
+        Rows are streamed into flat lists and (person, movie) edge arrays,
+        which are then bucketed into CSR form. Names are indexed by a
+        sorted order array rather than a dictionary of sets.
+        """
+        person_ids, person_names, person_births = [], [], []
+        with open(f"{directory}/people.csv", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            id_, name, birth = (header.index(field) for field in ("id", "name", "birth"))
+            for row in reader:
+                person_ids.append(row[id_])
+                person_names.append(row[name])
+                person_births.append(row[birth])
+
+        movie_ids, movie_titles, movie_years = [], [], []
+        with open(f"{directory}/movies.csv", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            id_, title, year = (header.index(field) for field in ("id", "title", "year"))
+            for row in reader:
+                movie_ids.append(row[id_])
+                movie_titles.append(row[title])
+                movie_years.append(row[year])
+
+        person_index = {person_id: i for i, person_id in enumerate(person_ids)}
+        movie_index = {movie_id: i for i, movie_id in enumerate(movie_ids)}
+
+        edge_people = array("q")
+        edge_movies = array("q")
+        with open(f"{directory}/stars.csv", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            person_id, movie_id = (header.index(field) for field in ("person_id", "movie_id"))
+            for row in reader:
+                person = person_index.get(row[person_id])
+                movie = movie_index.get(row[movie_id])
+                if person is None or movie is None:
+                    continue
+                edge_people.append(person)
+                edge_movies.append(movie)
+
+        person_offsets, person_movies = build_csr(
+            len(person_ids), edge_people, edge_movies
+        )
+        movie_offsets, movie_people = build_csr(
+            len(movie_ids), edge_movies, edge_people
+        )
+        name_order = array("q", sorted(
+            range(len(person_names)), key=lambda i: person_names[i].lower()
+        ))
+        return cls(person_ids, movie_ids,
+                   person_offsets, person_movies,
+                   movie_offsets, movie_people,
+                   person_names=person_names, person_births=person_births,
+                   movie_titles=movie_titles, movie_years=movie_years,
+                   person_index=person_index, movie_index=movie_index,
+                   names=SortedIndex(
+                       person_names, name_order,
+                       values=person_ids, transform=str.lower
+                   ))
+
+    def person(self, person):
+        """
+        Return the Person record for person index `person`.
+        """
+        return Person(self.person_ids[person],
+                      self.person_names[person],
+                      self.person_births[person])
+
+    def movie(self, movie):
+        """
+        Return the Movie record for movie index `movie`.
+        """
+        return Movie(self.movie_ids[movie],
+                     self.movie_titles[movie],
+                     self.movie_years[movie])
+
+    def movies_of(self, person):
+        """
+        Return the movie indices person `person` starred in.
+        """
+        if person + 1 < len(self.person_offsets):
+            movies = self.person_movies[
+                self.person_offsets[person]:self.person_offsets[person + 1]
+            ]
+        else:
+            movies = ()
+        if self.added_movies and person in self.added_movies:
+            return list(movies) + self.added_movies[person]
+        return movies
+
+    def stars_of(self, movie):
+        """
+        Return the person indices who starred in movie `movie`.
+        """
+        if movie + 1 < len(self.movie_offsets):
+            stars = self.movie_people[
+                self.movie_offsets[movie]:self.movie_offsets[movie + 1]
+            ]
+        else:
+            stars = ()
+        if self.added_stars and movie in self.added_stars:
+            return list(stars) + self.added_stars[movie]
+        return stars
+
+    def add_person(self, person_id, name, birth):
+        """
+        Append a person to the live graph and return their index, or
+        return the existing index if `person_id` is already known.
+        """
+        if person_id in self.person_index:
+            return self.person_index[person_id]
+        self._make_appendable()
+        person = len(self.person_ids)
+        self.person_ids.append(person_id)
+        self.person_names.append(name)
+        self.person_births.append(birth)
+        self.person_index[person_id] = person
+        if isinstance(self.names, dict):
+            self.names.setdefault(name.lower(), set()).add(person_id)
+        else:
+            self.names.add(name.lower(), person_id)
+        return person
+
+    def add_movie(self, movie_id, title, year):
+        """
+        Append a movie to the live graph and return its index, or
+        return the existing index if `movie_id` is already known.
+        """
+        if movie_id in self.movie_index:
+            return self.movie_index[movie_id]
+        self._make_appendable()
+        movie = len(self.movie_ids)
+        self.movie_ids.append(movie_id)
+        self.movie_titles.append(title)
+        self.movie_years.append(year)
+        self.movie_index[movie_id] = movie
+        return movie
+
+    def add_star(self, person, movie):
+        """
+        Record that person index `person` starred in movie index `movie`.
+        Return the people who were already in the movie's cast, or None
+        if the edge was already present.
+
+        Cached co-star lists of everyone affected are dropped, and the
+        precomputed projection, if any, is patched in place.
+        """
+        stars = list(self.stars_of(movie))
+        if person in stars:
+            return None
+        self.added_movies.setdefault(person, []).append(movie)
+        self.added_stars.setdefault(movie, []).append(person)
+
+        self.costar_cache.invalidate(person)
+        for star in stars:
+            self.costar_cache.invalidate(star)
+        if self.projection is not None:
+            known = {star for _, star in self.costars(person)}
+            for star in stars:
+                if star not in known:
+                    self.projection_added.setdefault(person, []).append((movie, star))
+                    self.projection_added.setdefault(star, []).append((movie, person))
+        return stars
+
+    def _make_appendable(self):
+        """
+        Wrap any read-only sequences and indexes (such as those mapped
+        from a snapshot) so that new people and movies can be appended.
+        """
+        for name in ["person_ids", "person_names", "person_births",
+                     "movie_ids", "movie_titles", "movie_years"]:
+            sequence = getattr(self, name)
+            if not isinstance(sequence, (list, Appendable)):
+                setattr(self, name, Appendable(sequence))
+        for name in ["person_index", "movie_index", "names"]:
+            index = getattr(self, name)
+            if not isinstance(index, (dict, IndexOverlay)):
+                setattr(self, name, IndexOverlay(index, name == "names"))
+
+    def costars(self, person):
+        """
+        Return (movie, person) index pairs for every distinct person who
+        starred with `person`, keeping one witness movie per co-star.
+
+        Answers come from the precomputed projection once `project` has
+        been called, and otherwise from a bounded LRU cache, so a hub's
+        co-stars are gathered once rather than on every visit.
+        """
+        if self.projection is not None:
+            offsets, costar_people, costar_movies = self.projection
+            pairs = []
+            if person + 1 < len(offsets):
+                start, end = offsets[person], offsets[person + 1]
+                pairs = list(zip(costar_movies[start:end], costar_people[start:end]))
+            return pairs + self.projection_added.get(person, [])
+
+        pairs = self.costar_cache.get(person)
+        if pairs is None:
+            pairs = self._costars(person)
+            self.costar_cache.put(person, pairs)
+        return pairs
+
+    def _costars(self, person):
+        """
+        Gather the co-stars of `person` from the person/movie adjacency.
+        """
+        witness = {}
+        for movie in self.movies_of(person):
+            for star in self.stars_of(movie):
+                if star != person and star not in witness:
+                    witness[star] = movie
+        return tuple((movie, star) for star, movie in witness.items())
+
+    def project(self):
+        """
+        Precompute the person-to-person co-star projection for everyone,
+        stored as CSR arrays of co-stars and their witness movies.
+        """
+        offsets = array("q", [0])
+        costar_people = array("q")
+        costar_movies = array("q")
+        for person in range(len(self.person_ids)):
+            for movie, star in self._costars(person):
+                costar_movies.append(movie)
+                costar_people.append(star)
+            offsets.append(len(costar_people))
+        self.projection = (offsets, costar_people, costar_movies)
+        self.projection_added = {}
+
+    def shortest_path(self, source, target):
+        """
+        Return the shortest list of (movie, person) index pairs that
+        leads from person `source` to person `target`, or None if the
+        two are not connected.
+
+        Breadth-first search runs from both ends at once, always
+        expanding whichever frontier is smaller by one full level, and
+        stops as soon as the two searches meet. The number of people
+        expanded is left in `self.expansions`.
+        """
+        self.expansions = 0
+        if source == target:
+            return []
+
+        # Parent maps: person -> (movie, person one step closer to the root)
+        forward = {source: None}
+        backward = {target: None}
+        forward_frontier = [source]
+        backward_frontier = [target]
+        forward_movies = set()
+        backward_movies = set()
+
+        while forward_frontier and backward_frontier:
+            if len(forward_frontier) <= len(backward_frontier):
+                forward_frontier, meet = self._expand(
+                    forward_frontier, forward, forward_movies, backward
+                )
+            else:
+                backward_frontier, meet = self._expand(
+                    backward_frontier, backward, backward_movies, forward
+                )
+            if meet is not None:
+                return self._join(forward, backward, meet)
+
+        return None
+
+    def distances(self, source):
+        """
+        Return an array of breadth-first distances from person `source`
+        to every person, with -1 for people `source` cannot reach.
+        """
+        distance = array("q", [-1]) * len(self.person_ids)
+        distance[source] = 0
+        seen_movies = bytearray(len(self.movie_ids))
+        frontier = [source]
+        depth = 0
+        while frontier:
+            depth += 1
+            next_frontier = []
+            for person in frontier:
+                for movie in self.movies_of(person):
+                    if seen_movies[movie]:
+                        continue
+                    seen_movies[movie] = 1
+                    for neighbor in self.stars_of(movie):
+                        if distance[neighbor] < 0:
+                            distance[neighbor] = depth
+                            next_frontier.append(neighbor)
+            frontier = next_frontier
+        return distance
+
+    def _expand(self, frontier, parents, seen_movies, other):
+        """
+        Expand `frontier` by one level, recording parents in `parents`.
+        Return the next frontier and the first person also reached by
+        the opposite search (`other`), or None if the searches have not met.
+
+        A movie's whole cast is discovered the first time the movie is
+        expanded, so each movie is expanded at most once per direction.
+        """
+        next_frontier = []
+        for person in frontier:
+            self.expansions += 1
+            for movie in self.movies_of(person):
+                if movie in seen_movies:
+                    continue
+                seen_movies.add(movie)
+                for neighbor in self.stars_of(movie):
+                    if neighbor in parents:
+                        continue
+                    parents[neighbor] = (movie, person)
+                    if neighbor in other:
+                        return next_frontier, neighbor
+                    next_frontier.append(neighbor)
+        return next_frontier, None
+
+    @staticmethod
+    def _join(forward, backward, meet):
+        """
+        Stitch the forward and backward parent chains together at `meet`.
+        """
+        path = []
+        person = meet
+        while forward[person] is not None:
+            movie, parent = forward[person]
+            path.append((movie, person))
+            person = parent
+        path.reverse()
+
+        person = meet
+        while backward[person] is not None:
+            movie, child = backward[person]
+            path.append((movie, child))
+            person = child
+        return path
+
+
+def build_csr(n, rows, columns):
+    """
+    Bucket the edges (rows[i], columns[i]) into CSR form over `n` rows.
+    Return (offsets, values) with each row's columns sorted and
+    duplicate edges dropped.
+    """
+    counts = array("q", bytes(8 * (n + 1)))
+    for row in rows:
+        counts[row + 1] += 1
+    offsets = array("q", itertools.accumulate(counts))
+    values = array("q", bytes(8 * len(rows)))
+    fill = array("q", offsets)
+    for row, column in zip(rows, columns):
+        values[fill[row]] = column
+        fill[row] += 1
+
+    deduplicated_offsets = array("q", [0])
+    deduplicated = array("q")
+    for row in range(n):
+        deduplicated.extend(sorted(set(values[offsets[row]:offsets[row + 1]])))
+        deduplicated_offsets.append(len(deduplicated))
+    return deduplicated_offsets, deduplicated
+
+
+class Appendable():
+
+    def __init__(self, base):
+        """
+        A sequence that appends to a list kept after a read-only `base`.
+        """
+        self.base = base
+        self.added = []
+
+    def __len__(self):
+        return len(self.base) + len(self.added)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if i < len(self.base):
+            return self.base[i]
+        return self.added[i - len(self.base)]
+
+    def __iter__(self):
+        yield from self.base
+        yield from self.added
+
+    def append(self, value):
+        self.added.append(value)
+
+
+class IndexOverlay():
+
+    def __init__(self, base, multi=False):
+        """
+        A mapping that layers a dictionary of added keys over a read-only
+        `base` index. With `multi`, values are sets of ids and lookups
+        return the union of the base and added sets.
+        """
+        self.base = base
+        self.multi = multi
+        self.added = {}
+
+    def get(self, key, default=None):
+        value = self.base.get(key)
+        if key not in self.added:
+            return default if value is None else value
+        if not self.multi:
+            return self.added[key]
+        return (value or set()) | self.added[key]
+
+    def __getitem__(self, key):
+        result = self.get(key)
+        if result is None:
+            raise KeyError(key)
+        return result
+
+    def __setitem__(self, key, value):
+        self.added[key] = value
+
+    def __contains__(self, key):
+        return key in self.added or key in self.base
+
+    def add(self, key, value):
+        self.added.setdefault(key, set()).add(value)
+
+
+class LRUCache():
+
+    def __init__(self, maxsize):
+        """
+        A dictionary cache holding at most `maxsize` entries, evicting the
+        least recently used, with hit and miss counters.
+        """
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Return the cached value for `key`, or None on a miss.
+        """
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+    def info(self):
+        """
+        Return the cache's hit/miss counters and current size.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "maxsize": self.maxsize,
+            "size": len(self.entries)
+        }
+
+
+class SortedIndex():
+
+    def __init__(self, keys, order, values=None, transform=None):
+        """
+        A read-only mapping from key to index, answered by binary search.
+
+        `order` lists indices into `keys` sorted by `transform(keys[i])`.
+        Looking up a key returns its index, or with `values` given, the
+        set of `values[i]` for every index whose key matches.
+        """
+        self.keys = keys
+        self.order = order
+        self.values = values
+        self.transform = transform or (lambda key: key)
+
+    def _key(self, i):
+        return self.transform(self.keys[i])
+
+    def _range(self, key):
+        lo = bisect.bisect_left(self.order, key, key=self._key)
+        hi = bisect.bisect_right(self.order, key, lo=lo, key=self._key)
+        return lo, hi
+
+    def get(self, key, default=None):
+        lo, hi = self._range(key)
+        if lo == hi:
+            return default
+        if self.values is None:
+            return self.order[lo]
+        return {self.values[self.order[i]] for i in range(lo, hi)}
+
+    def __getitem__(self, key):
+        result = self.get(key)
+        if result is None:
+            raise KeyError(key)
+        return result
+
+    def __contains__(self, key):
+        lo, hi = self._range(key)
+        return lo != hi
+
+    def __len__(self):
+        return len(self.order)
@@ -0,0 +1,325 @@
+import argparse
+import csv
+import heapq
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+from array import array
+
+import snapshot
+
+# Records held in memory by each sorter before it spills a sorted run
+CHUNK_ROWS = 500000
+
+# Records pickled together within a run file
+BATCH_ROWS = 10000
+
+# Array items buffered before an ArrayWriter appends them to its file
+ARRAY_BUFFER = 1 << 16
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the degrees snapshot from CSVs in bounded memory."
+    )
+    parser.add_argument("directory")
+    parser.add_argument(
+        "--chunk-rows", type=int, default=CHUNK_ROWS,
+        help="records held in memory per sorted run"
+    )
+    parser.add_argument(
+        "--workdir", help="directory for temporary run files (default: system temp)"
+    )
+    args = parser.parse_args()
+    build(args.directory, chunk_rows=args.chunk_rows, workdir=args.workdir)
+
+
+class ExternalSorter():
+
+    def __init__(self, workdir, chunk_rows=CHUNK_ROWS):
+        """
+        Sort an unbounded stream of tuples using at most `chunk_rows`
+        records of memory, spilling sorted runs to files in `workdir`
+        and merging them when iterated.
+        """
+        self.workdir = workdir
+        self.chunk_rows = chunk_rows
+        self.buffer = []
+        self.runs = []
+
+    def add(self, record):
+        self.buffer.append(record)
+        if len(self.buffer) >= self.chunk_rows:
+            self._spill()
+
+    def _spill(self):
+        self.buffer.sort()
+        fd, path = tempfile.mkstemp(suffix=".run", dir=self.workdir)
+        with os.fdopen(fd, "wb") as f:
+            for i in range(0, len(self.buffer), BATCH_ROWS):
+                pickle.dump(self.buffer[i:i + BATCH_ROWS], f, pickle.HIGHEST_PROTOCOL)
+        self.runs.append(path)
+        self.buffer = []
+
+    @staticmethod
+    def _read(path):
+        with open(path, "rb") as f:
+            while True:
+                try:
+                    batch = pickle.load(f)
+                except EOFError:
+                    return
+                yield from batch
+
+    def __iter__(self):
+        """
+        Yield every record added so far in sorted order.
+        """
+        if not self.runs:
+            self.buffer.sort()
+            return iter(self.buffer)
+        if self.buffer:
+            self._spill()
+        return heapq.merge(*(self._read(path) for path in self.runs))
+
+
+class ArrayWriter():
+
+    def __init__(self, path, typecode="q"):
+        """
+        Append integers to a raw native-endian array file at `path`.
+        """
+        self.path = path
+        self.file = open(path, "wb")
+        self.buffer = array(typecode)
+        self.count = 0
+
+    def append(self, value):
+        self.buffer.append(value)
+        self.count += 1
+        if len(self.buffer) >= ARRAY_BUFFER:
+            self.buffer.tofile(self.file)
+            del self.buffer[:]
+
+    def close(self):
+        self.buffer.tofile(self.file)
+        self.file.close()
+
+
+class StringWriter():
+
+    def __init__(self, workdir, name):
+        """
+        Stream strings into the blob and offsets files of a snapshot
+        string table named `name`.
+        """
+        self.blob_path = os.path.join(workdir, f"{name}_blob")
+        self.blob = open(self.blob_path, "wb")
+        self.offsets = ArrayWriter(os.path.join(workdir, f"{name}_offsets"))
+        self.offsets.append(0)
+        self.length = 0
+
+    def append(self, s):
+        encoded = s.encode("utf-8")
+        self.blob.write(encoded)
+        self.length += len(encoded)
+        self.offsets.append(self.length)
+
+    def close(self):
+        self.blob.close()
+        self.offsets.close()
+
+
+class Progress():
+
+    def __init__(self, out=sys.stderr):
+        """
+        Time ingestion phases and report their throughput to `out`.
+        """
+        self.out = out
+        self.start = time.perf_counter()
+        self.phase_start = self.start
+
+    def phase(self, name, rows):
+        now = time.perf_counter()
+        elapsed = now - self.phase_start
+        self.phase_start = now
+        rate = rows / elapsed if elapsed > 0 else float("inf")
+        print(f"{name}: {rows} rows in {elapsed:.2f}s ({rate:,.0f} rows/s)", file=self.out)
+
+    def done(self, rows):
+        elapsed = time.perf_counter() - self.start
+        rate = rows / elapsed if elapsed > 0 else float("inf")
+        print(f"Total: {rows} CSV rows in {elapsed:.2f}s ({rate:,.0f} rows/s)",
+              file=self.out)
+
+
+def read_csv(path, fields):
+    """
+    Yield the `fields` columns of every row of the CSV at `path`.
+    """
+    with open(path, encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        columns = [header.index(field) for field in fields]
+        for row in reader:
+            yield [row[column] for column in columns]
+
+
+def merge_join(records, keys, order):
+    """
+    Join `records` sorted by their first field against `keys`, sorted
+    (id, index) pairs, yielding (index, rest of record) for each match.
+    Every index is also appended to `order` in id order.
+    """
+    keys = iter(keys)
+    current = next(keys, None)
+    for record in records:
+        while current is not None and current[0] < record[0]:
+            order.append(current[1])
+            current = next(keys, None)
+        if current is not None and current[0] == record[0]:
+            yield current[1], record[1:]
+    while current is not None:
+        order.append(current[1])
+        current = next(keys, None)
+
+
+def write_csr(edges, n, offsets, values):
+    """
+    Write sorted (row, column) `edges` over `n` rows as CSR arrays to
+    the `offsets` and `values` writers, dropping duplicate edges.
+    """
+    offsets.append(0)
+    row = 0
+    previous = None
+    for edge in edges:
+        if edge == previous:
+            continue
+        previous = edge
+        while row < edge[0]:
+            offsets.append(values.count)
+            row += 1
+        values.append(edge[1])
+    while row < n:
+        offsets.append(values.count)
+        row += 1
+
+
+def build(directory, path=None, chunk_rows=CHUNK_ROWS, workdir=None, out=sys.stderr):
+    """
+    Build the snapshot for the CSVs in `directory` without holding the
+    data in memory: rows stream into string tables and external sorters,
+    stars are resolved to indices by sort-merge joins against the sorted
+    ids, and the CSR arrays are written from sorted edge runs.
+    Throughput for each phase is reported to `out`.
+    """
+    path = path or os.path.join(directory, snapshot.FILENAME)
+    sources = snapshot.source_info(directory)
+    work = tempfile.mkdtemp(prefix="degrees-", dir=workdir)
+    progress = Progress(out)
+    try:
+        def sorter():
+            return ExternalSorter(work, chunk_rows)
+
+        def writer(name):
+            return ArrayWriter(os.path.join(work, name))
+
+        strings = {
+            name: StringWriter(work, name)
+            for name in ["person_ids", "person_names", "person_births",
+                         "movie_ids", "movie_titles", "movie_years"]
+        }
+
+        # People: string tables plus (id, index) and (name, index) runs
+        person_keys = sorter()
+        name_keys = sorter()
+        people = 0
+        for person_id, name, birth in read_csv(
+            os.path.join(directory, "people.csv"), ["id", "name", "birth"]
+        ):
+            strings["person_ids"].append(person_id)
+            strings["person_names"].append(name)
+            strings["person_births"].append(birth)
+            person_keys.add((person_id, people))
+            name_keys.add((name.lower(), people))
+            people += 1
+        progress.phase("people.csv", people)
+
+        movie_keys = sorter()
+        movies = 0
+        for movie_id, title, year in read_csv(
+            os.path.join(directory, "movies.csv"), ["id", "title", "year"]
+        ):
+            strings["movie_ids"].append(movie_id)
+            strings["movie_titles"].append(title)
+            strings["movie_years"].append(year)
+            movie_keys.add((movie_id, movies))
+            movies += 1
+        progress.phase("movies.csv", movies)
+        for table in strings.values():
+            table.close()
+
+        by_person = sorter()
+        stars = 0
+        for person_id, movie_id in read_csv(
+            os.path.join(directory, "stars.csv"), ["person_id", "movie_id"]
+        ):
+            by_person.add((person_id, movie_id))
+            stars += 1
+        progress.phase("stars.csv", stars)
+
+        # Resolve person ids, then movie ids, dropping unknown ones
+        person_order = writer("person_order")
+        by_movie = sorter()
+        for person, (movie_id,) in merge_join(by_person, person_keys, person_order):
+            by_movie.add((movie_id, person))
+        person_order.close()
+
+        movie_order = writer("movie_order")
+        person_edges = sorter()
+        movie_edges = sorter()
+        edges = 0
+        for movie, (person,) in merge_join(by_movie, movie_keys, movie_order):
+            person_edges.add((person, movie))
+            movie_edges.add((movie, person))
+            edges += 1
+        movie_order.close()
+        progress.phase("join", edges)
+
+        sections = {}
+        for offsets_name, values_name, sorted_edges, n in [
+            ("person_offsets", "person_movies", person_edges, people),
+            ("movie_offsets", "movie_people", movie_edges, movies)
+        ]:
+            offsets = writer(offsets_name)
+            values = writer(values_name)
+            write_csr(sorted_edges, n, offsets, values)
+            offsets.close()
+            values.close()
+            sections[offsets_name] = offsets.path
+            sections[values_name] = values.path
+        for name, table in strings.items():
+            sections[f"{name}_blob"] = table.blob_path
+            sections[f"{name}_offsets"] = table.offsets.path
+        sections["person_order"] = person_order.path
+        sections["movie_order"] = movie_order.path
+
+        name_order = writer("name_order")
+        for _, person in name_keys:
+            name_order.append(person)
+        name_order.close()
+        sections["name_order"] = name_order.path
+        progress.phase("csr", edges)
+
+        snapshot.write(path, sections, sources)
+        progress.done(people + movies + stars)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+import hashlib
+import itertools
+import json
+import mmap
+import os
+import shutil
+import struct
+from array import array
+
+from graph import Graph, SortedIndex
+
+MAGIC = b"DEGSNAP1"
+FILENAME = "degrees.snapshot"
+SOURCES = ["people.csv", "movies.csv", "stars.csv"]
+
+
+class StringTable():
+
+    def __init__(self, blob, offsets):
+        """
+        A read-only sequence of strings packed into one UTF-8 `blob`.
+        String `i` is `blob[offsets[i]:offsets[i + 1]]`, decoded on access.
+        """
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def pack(cls, strings):
+        """
+        StringTable.pack(strings) returns the (blob, offsets) pair
+        encoding the iterable `strings`.
+        """
+        encoded = [s.encode("utf-8") for s in strings]
+        offsets = array("q", [0])
+        offsets.extend(itertools.accumulate(map(len, encoded)))
+        return b"".join(encoded), offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("string table index out of range")
+        return str(self.blob[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def fingerprint(path):
+    """
+    Return the SHA-1 hex digest of the file at `path`.
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_info(directory):
+    """
+    Return the mtime, size and hash of each source CSV in `directory`.
+    """
+    info = {}
+    for filename in SOURCES:
+        path = os.path.join(directory, filename)
+        stat = os.stat(path)
+        info[filename] = {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha1": fingerprint(path)
+        }
+    return info
+
+
+def is_fresh(directory, recorded):
+    """
+    Return True if the CSVs in `directory` still match `recorded`.
+
+    Files whose mtime and size are unchanged are trusted as-is; only
+    files that were touched get hashed, so a `touch` alone does not
+    force a rebuild.
+    """
+    for filename in SOURCES:
+        path = os.path.join(directory, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        entry = recorded.get(filename)
+        if entry is None:
+            return False
+        if (stat.st_mtime_ns == entry["mtime_ns"] and
+                stat.st_size == entry["size"]):
+            continue
+        if stat.st_size != entry["size"] or fingerprint(path) != entry["sha1"]:
+            return False
+    return True
+
+
+def save(directory, graph, path=None):
+    """
+    Write `graph` as a snapshot file for the CSVs in `directory`.
+    """
+    path = path or os.path.join(directory, FILENAME)
+    sections = {
+        "person_offsets": graph.person_offsets,
+        "person_movies": graph.person_movies,
+        "movie_offsets": graph.movie_offsets,
+        "movie_people": graph.movie_people
+    }
+    for name, strings in [
+        ("person_ids", graph.person_ids),
+        ("person_names", graph.person_names),
+        ("person_births", graph.person_births),
+        ("movie_ids", graph.movie_ids),
+        ("movie_titles", graph.movie_titles),
+        ("movie_years", graph.movie_years)
+    ]:
+        sections[f"{name}_blob"], sections[f"{name}_offsets"] = (
+            StringTable.pack(strings)
+        )
+
+    # Sort orders used to answer id and name lookups by binary search
+    sections["person_order"] = array("q", sorted(
+        range(len(graph.person_ids)), key=lambda i: graph.person_ids[i]
+    ))
+    sections["movie_order"] = array("q", sorted(
+        range(len(graph.movie_ids)), key=lambda i: graph.movie_ids[i]
+    ))
+    sections["name_order"] = array("q", sorted(
+        range(len(graph.person_names)),
+        key=lambda i: graph.person_names[i].lower()
+    ))
+
+    write(path, sections, source_info(directory))
+
+
+def write(path, sections, sources):
+    """
+    Write a snapshot file at `path`: a magic number, a JSON header
+    (source fingerprints and a table of contents), then 8-byte aligned
+    binary sections.
+
+    Each section is an array, a bytes object, or the path of a file
+    whose contents are copied in.
+    """
+    toc = {}
+    offset = 0
+    for name, data in sections.items():
+        if isinstance(data, str):
+            length = os.path.getsize(data)
+        elif isinstance(data, array):
+            length = len(data) * data.itemsize
+        else:
+            length = len(data)
+        toc[name] = [offset, length]
+        offset += length + (-length % 8)
+    header = json.dumps({
+        "sources": sources,
+        "sections": toc
+    }).encode("utf-8")
+    header += b" " * (-(len(MAGIC) + 8 + len(header)) % 8)
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<q", len(header)))
+        f.write(header)
+        for name, data in sections.items():
+            if isinstance(data, str):
+                with open(data, "rb") as section:
+                    shutil.copyfileobj(section, f, 1 << 20)
+            else:
+                f.write(data.tobytes() if isinstance(data, array) else data)
+            f.write(b"\0" * (-toc[name][1] % 8))
+    os.replace(tmp, path)
+
+
+def load(directory, path=None):
+    """
+    Memory-map the snapshot for `directory` and return its Graph, or
+    None if there is no snapshot, it is stale with respect to the CSVs,
+    or it is truncated or corrupt.
+    """
+    path = path or os.path.join(directory, FILENAME)
+    try:
+        f = open(path, "rb")
+    except OSError:
+        return None
+    with f:
+        if f.read(len(MAGIC)) != MAGIC:
+            return None
+        try:
+            (header_length,) = struct.unpack("<q", f.read(8))
+            header = json.loads(f.read(header_length))
+            if not is_fresh(directory, header["sources"]):
+                return None
+            toc = header["sections"]
+            base = len(MAGIC) + 8 + header_length
+            size = os.fstat(f.fileno()).st_size
+            if any(base + offset + length > size for offset, length in toc.values()):
+                return None
+        except (struct.error, ValueError, KeyError, TypeError, AttributeError):
+            return None
+        buffer = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def section(name, typecode="q"):
+        offset, length = toc[name]
+        view = buffer[base + offset:base + offset + length]
+        return view.cast(typecode) if typecode else view
+
+    def strings(name):
+        return StringTable(section(f"{name}_blob", None), section(f"{name}_offsets"))
+
+    try:
+        person_ids = strings("person_ids")
+        movie_ids = strings("movie_ids")
+        person_names = strings("person_names")
+        return Graph(
+            person_ids, movie_ids,
+            section("person_offsets"), section("person_movies"),
+            section("movie_offsets"), section("movie_people"),
+            person_names=person_names,
+            person_births=strings("person_births"),
+            movie_titles=strings("movie_titles"),
+            movie_years=strings("movie_years"),
+            person_index=SortedIndex(person_ids, section("person_order")),
+            movie_index=SortedIndex(movie_ids, section("movie_order")),
+            names=SortedIndex(
+                person_names, section("name_order"),
+                values=person_ids, transform=str.lower
+            )
+        )
+    except (KeyError, TypeError, ValueError):
+        return None
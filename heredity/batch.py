@@ -0,0 +1,264 @@
+import argparse
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import pickle
+import sys
+
+import numpy as np
+
+import heredity
+import inference
+import junction
+import sampling
+
+CACHE_FILENAME = "heredity.cache"
+CACHE_VERSION = 1
+
+# Results kept in the cache by default; the least recently used go first
+MAX_CACHE_ENTRIES = 10000
+
+METHODS = ["elimination", "junction", "enumeration"] + sampling.METHODS
+
+# Columns of the output file, after the family and person names
+COLUMNS = ["gene_2", "gene_1", "gene_0", "trait"]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Infer gene and trait probabilities for many families at once."
+    )
+    parser.add_argument(
+        "source", help="directory of family CSVs, or a manifest listing one per line"
+    )
+    parser.add_argument(
+        "--output", required=True,
+        help="file for every marginal: NumPy columns if it ends in .npz, CSV otherwise"
+    )
+    parser.add_argument("--method", choices=METHODS, default="elimination")
+    parser.add_argument("--workers", type=int, help="processes solving families (default: CPUs)")
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help=f"ignore and do not write the cache ({CACHE_FILENAME} beside the "
+             f"families; delete it to clear the cache)"
+    )
+    parser.add_argument(
+        "--max-cache", type=int, default=MAX_CACHE_ENTRIES, metavar="N",
+        help="keep at most N results in the cache, dropping the least recently used"
+    )
+    parser.add_argument("--samples", type=int, default=10000)
+    parser.add_argument("--chains", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    files = family_files(args.source)
+    options = {"method": args.method}
+    if args.method in sampling.METHODS:
+        options.update(samples=args.samples, chains=args.chains, seed=args.seed)
+    directory = args.source if os.path.isdir(args.source) else os.path.dirname(args.source)
+    results, failures = run(
+        files, options, args.workers, None if args.no_cache else directory, args.max_cache
+    )
+    for filename, message in failures.items():
+        print(f"Skipped {filename}: {message}", file=sys.stderr)
+    write_results(args.output, results)
+    print(f"Wrote {sum(len(result[0]) for result in results.values())} people "
+          f"from {len(results)} families to {args.output}", file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+def family_files(source):
+    """
+    Return the family CSVs named by `source`: every .csv file in it if
+    it is a directory, or else every line of it as a manifest, relative
+    to the manifest's directory. Blank lines and lines starting with #
+    in a manifest are skipped.
+    """
+    if os.path.isdir(source):
+        return sorted(
+            os.path.join(source, name) for name in os.listdir(source) if name.endswith(".csv")
+        )
+    base = os.path.dirname(source)
+    with open(source) as f:
+        lines = [line.strip() for line in f]
+    return [
+        os.path.join(base, line) for line in lines if line and not line.startswith("#")
+    ]
+
+
+def cache_key(filename, options):
+    """
+    Return a hash of the contents of `filename`, the PROBS table and
+    the inference `options`, which together determine the results.
+    """
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    digest.update(json.dumps(heredity.PROBS, sort_keys=True).encode())
+    digest.update(json.dumps(options, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def solve(filename, options):
+    """
+    Return (probabilities, errors) for the family in `filename` by the
+    inference method in `options`; errors are None for exact methods.
+    """
+    people = heredity.load_data(filename)
+    method = options["method"]
+    if method in sampling.METHODS:
+        # Pool workers cannot start pools of their own
+        return sampling.estimate(
+            people, heredity.PROBS, method, options["samples"],
+            options["chains"], options["seed"], workers=1
+        )
+    if method == "junction":
+        tree = junction.JunctionTree.load(filename, people)
+        evidence = {person: people[person]["trait"] for person in people}
+        return tree.calibrate(heredity.PROBS, [evidence])[0], None
+    if method == "enumeration":
+        return inference.enumerate_marginals(people, heredity.PROBS), None
+    return inference.marginals(people, heredity.PROBS), None
+
+
+def attempt(filename, options):
+    """
+    Return ("ok", result) from `solve`, or ("error", message) if the
+    family could not be solved, so one bad file does not stop a batch.
+    """
+    try:
+        return "ok", solve(filename, options)
+    except Exception as error:
+        return "error", str(error)
+
+
+def load_cache(directory):
+    """
+    Return the results cached in `directory`, or an empty cache.
+    """
+    try:
+        with open(os.path.join(directory, CACHE_FILENAME), "rb") as f:
+            cache = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return {"version": CACHE_VERSION, "results": {}}
+    if not isinstance(cache, dict) or cache.get("version") != CACHE_VERSION:
+        return {"version": CACHE_VERSION, "results": {}}
+    return cache
+
+
+def save_cache(directory, cache):
+    """
+    Atomically write `cache` to `directory`, ignoring directories that
+    cannot be written to.
+    """
+    path = os.path.join(directory, CACHE_FILENAME)
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump(cache, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def run(files, options, workers=None, cache_directory=None, max_cache=MAX_CACHE_ENTRIES):
+    """
+    Return (results, failures) for the families in `files`: results
+    maps each solved file to its (probabilities, errors), failures maps
+    the rest to why they failed.
+
+    Files whose contents, PROBS and `options` match an entry of the
+    cache in `cache_directory` (if given) reuse it. The rest are
+    solved across a pool of `workers` processes (default: one per
+    CPU), which pay for interpreter start-up and imports once rather
+    than once per file, and the cache is updated, keeping only the
+    `max_cache` most recently used results.
+    """
+    cache = load_cache(cache_directory) if cache_directory else {"results": {}}
+    entries = cache["results"]
+    keys = {}
+    results = {}
+    failures = {}
+    for filename in files:
+        try:
+            keys[filename] = cache_key(filename, options)
+        except OSError as error:
+            failures[filename] = str(error)
+            continue
+        if keys[filename] in entries:
+            # Reinserting marks the entry as the most recently used
+            results[filename] = entries[keys[filename]] = entries.pop(keys[filename])
+    missing = [filename for filename in keys if filename not in results]
+
+    workers = min(workers or os.cpu_count() or 1, max(len(missing), 1))
+    tasks = [(filename, options) for filename in missing]
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            outcomes = pool.starmap(attempt, tasks, chunksize=max(1, len(tasks) // (4 * workers)))
+    else:
+        outcomes = [attempt(*task) for task in tasks]
+
+    for filename, (status, value) in zip(missing, outcomes):
+        if status == "ok":
+            results[filename] = value
+            entries[keys[filename]] = value
+        else:
+            failures[filename] = value
+    if cache_directory and results:
+        for key in list(entries)[:max(len(entries) - max_cache, 0)]:
+            del entries[key]
+        save_cache(cache_directory, cache)
+    return {filename: results[filename] for filename in files if filename in results}, failures
+
+
+def write_results(path, results):
+    """
+    Write every person's marginals in `results` to `path`, one column
+    per field: a family column, a person column, each of COLUMNS, and
+    a standard error column for each when the results are estimates.
+
+    A path ending in .npz gets one compressed NumPy array per column;
+    any other path gets a CSV with a header row.
+    """
+    columns = {"family": [], "person": []}
+    for name in COLUMNS:
+        columns[name] = []
+    estimated = any(errors is not None for _, errors in results.values())
+    if estimated:
+        for name in COLUMNS:
+            columns[f"{name}_se"] = []
+
+    for filename, (probabilities, errors) in results.items():
+        for person, distributions in probabilities.items():
+            columns["family"].append(filename)
+            columns["person"].append(person)
+            values = [distributions["gene"][2], distributions["gene"][1],
+                      distributions["gene"][0], distributions["trait"][True]]
+            for name, value in zip(COLUMNS, values):
+                columns[name].append(value)
+            if estimated:
+                spread = [np.nan] * len(COLUMNS)
+                if errors is not None:
+                    spread = [errors[person]["gene"][2], errors[person]["gene"][1],
+                              errors[person]["gene"][0], errors[person]["trait"][True]]
+                for name, value in zip(COLUMNS, spread):
+                    columns[f"{name}_se"].append(value)
+
+    if path.endswith(".npz"):
+        np.savez_compressed(path, **{
+            name: np.array(values, dtype=str if name in ("family", "person") else float)
+            for name, values in columns.items()
+        })
+    else:
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            writer.writerows(zip(*columns.values()))
+
+
+if __name__ == "__main__":
+    main()
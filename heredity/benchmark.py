@@ -0,0 +1,89 @@
+import argparse
+import glob
+import json
+import os
+import time
+
+import heredity
+import inference
+import sampling
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for heredity.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convergence = subparsers.add_parser(
+        "convergence", help="compare sampling estimates with exact marginals"
+    )
+    convergence.add_argument(
+        "files", nargs="*", default=sorted(glob.glob(os.path.join(HERE, "data", "family*.csv")))
+    )
+    convergence.add_argument(
+        "--samples", type=int, nargs="+", default=[100, 1000, 10000, 100000]
+    )
+    convergence.add_argument("--methods", choices=sampling.METHODS, nargs="+", default=sampling.METHODS)
+    convergence.add_argument("--chains", type=int, default=4)
+    convergence.add_argument("--seed", type=int, default=0)
+    convergence.add_argument("--workers", type=int)
+    convergence.add_argument("--output", help="write the results to this file as JSON")
+
+    args = parser.parse_args()
+    if args.command == "convergence":
+        results = benchmark_convergence(
+            args.files, args.samples, args.methods, args.chains, args.seed, args.workers
+        )
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=1)
+
+
+def benchmark_convergence(files, counts, methods, chains, seed, workers):
+    """
+    Estimate the marginals of each family in `files` with every
+    sampling method and sample count, and print how far the estimates
+    are from the exact marginals next to the standard errors reported
+    for them. Return the rows printed as dictionaries.
+    """
+    print(f"{'family':<14}{'method':<22}{'samples':>9}{'seconds':>9}"
+          f"{'max error':>11}{'mean SE':>10}{'within 2 SE':>13}")
+    rows = []
+    for filename in files:
+        people = heredity.load_data(filename)
+        exact = inference.marginals(people, heredity.PROBS)
+        for method in methods:
+            for samples in counts:
+                start = time.perf_counter()
+                estimates, errors = sampling.estimate(
+                    people, heredity.PROBS, method, samples, chains, seed, workers
+                )
+                elapsed = time.perf_counter() - start
+                pairs = [
+                    (abs(estimates[person][field][value] - exact[person][field][value]),
+                     errors[person][field][value])
+                    for person in people
+                    for field in exact[person]
+                    for value in exact[person][field]
+                ]
+                row = {
+                    "family": os.path.basename(filename),
+                    "method": method,
+                    "samples": samples,
+                    "seconds": elapsed,
+                    "max_error": max(error for error, _ in pairs),
+                    "mean_standard_error": sum(se for _, se in pairs) / len(pairs),
+                    "within_two_standard_errors": sum(
+                        error <= 2 * se for error, se in pairs
+                    ) / len(pairs)
+                }
+                rows.append(row)
+                print(f"{row['family']:<14}{method:<22}{samples:>9}{elapsed:>9.2f}"
+                      f"{row['max_error']:>11.4f}{row['mean_standard_error']:>10.4f}"
+                      f"{row['within_two_standard_errors']:>13.2f}")
+    return rows
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
+import argparse
 import csv
 import itertools
-import sys
+
+import inference
+import junction
+import sampling
 
 PROBS = {
 
@@ -38,68 +42,68 @@ PROBS = {
 
 
 def main():
-
-    # Check for proper usage
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python heredity.py data.csv")
-    people = load_data(sys.argv[1])
-
-    # Keep track of gene and trait probabilities for each person
-    probabilities = {
-        person: {
-            "gene": {
-                2: 0,
-                1: 0,
-                0: 0
-            },
-            "trait": {
-                True: 0,
-                False: 0
-            }
-        }
-        for person in people
-    }
-
-    # Loop over all sets of people who might have the trait
-    names = set(people)
-    for have_trait in powerset(names):
-
-        # Check if current set of people violates known information
-        fails_evidence = any(
-            (people[person]["trait"] is not None and
-             people[person]["trait"] != (person in have_trait))
-            for person in names
-        )
-        if fails_evidence:
-            continue
-
-        # Loop over all sets of people who might have the gene
-        for one_gene in powerset(names):
-            for two_genes in powerset(names - one_gene):
-
-                # Update probabilities with new joint probability
-                p = joint_probability(people, one_gene, two_genes, have_trait)
-                update(probabilities, one_gene, two_genes, have_trait, p)
-
-    # Ensure probabilities sum to 1
-    normalize(probabilities)
+    parser = argparse.ArgumentParser(
+        description="Infer gene and trait probabilities for a family."
+    )
+    parser.add_argument("data", help="family CSV with name, mother, father, trait columns")
+    parser.add_argument(
+        "--method", choices=["elimination", "junction", "enumeration"] + sampling.METHODS,
+        default="elimination",
+        help="exact inference by variable elimination, by a junction tree cached "
+             "beside the data, or by enumerating every assignment; or estimates "
+             "by likelihood weighting or Gibbs sampling"
+    )
+    parser.add_argument("--samples", type=int, default=10000, help="samples to estimate from")
+    parser.add_argument("--chains", type=int, default=4, help="independent sampling chains")
+    parser.add_argument("--seed", type=int, help="seed for reproducible sampling")
+    parser.add_argument("--workers", type=int, help="processes running chains (default: CPUs)")
+    parser.add_argument(
+        "--traits", nargs="+", default=["trait"], metavar="COLUMN",
+        help="answer once for each of these trait columns of the CSV"
+    )
+    args = parser.parse_args()
+    families = [load_data(args.data, column) for column in args.traits]
+    errors = [None] * len(families)
+    if args.method in sampling.METHODS:
+        results, errors = zip(*(
+            sampling.estimate(
+                people, PROBS, args.method, args.samples, args.chains, args.seed, args.workers
+            )
+            for people in families
+        ))
+    elif args.method == "junction":
+        tree = junction.JunctionTree.load(args.data, families[0])
+        results = tree.calibrate(PROBS, [
+            {person: people[person]["trait"] for person in people} for people in families
+        ])
+    elif args.method == "elimination":
+        results = [inference.marginals(people, PROBS) for people in families]
+    else:
+        results = [inference.enumerate_marginals(people, PROBS) for people in families]
 
     # Print results
-    for person in people:
-        print(f"{person}:")
-        for field in probabilities[person]:
-            print(f"  {field.capitalize()}:")
-            for value in probabilities[person][field]:
-                p = probabilities[person][field][value]
-                print(f"    {value}: {p:.4f}")
-
-
-def load_data(filename):
+    for column, people, probabilities, error in zip(args.traits, families, results, errors):
+        if len(args.traits) > 1:
+            print(f"Evidence from {column}:")
+        for person in people:
+            print(f"{person}:")
+            for field in probabilities[person]:
+                print(f"  {field.capitalize()}:")
+                for value in probabilities[person][field]:
+                    p = probabilities[person][field][value]
+                    if error is None:
+                        print(f"    {value}: {p:.4f}")
+                    else:
+                        print(f"    {value}: {p:.4f} ± {error[person][field][value]:.4f}")
+
+
+def load_data(filename, trait="trait"):
     """
     Load gene and trait data from a file into a dictionary.
     File assumed to be a CSV containing fields name, mother, father, trait.
     mother, father must both be blank, or both be valid names in the CSV.
-    trait should be 0 or 1 if trait is known, blank otherwise.
+    trait should be 0 or 1 if trait is known, blank otherwise; another
+    column of the same form can be read as the trait instead.
     """
     data = dict()
     with open(filename) as f:
@@ -110,8 +114,8 @@ def load_data(filename):
                 "name": name,
                 "mother": row["mother"] or None,
                 "father": row["father"] or None,
-                "trait": (True if row["trait"] == "1" else
-                          False if row["trait"] == "0" else None)
+                "trait": (True if row[trait] == "1" else
+                          False if row[trait] == "0" else None)
             }
     return data
 
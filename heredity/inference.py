@@ -0,0 +1,388 @@
+import heapq
+
+import numpy as np
+
+# Letters naming factor axes in einsum subscripts
+AXES = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+# Most factors multiplied by one einsum call
+MAX_OPERANDS = 16
+
+# Assignments evaluated at a time when enumerating
+ENUMERATION_BATCH = 1 << 14
+
+# Most variables in a factor created during elimination. A factor over
+# k people has 3 ** k entries, so wider pedigrees are refused rather
+# than exhausting memory
+MAX_WIDTH = 14
+
+
+class Factor():
+
+    def __init__(self, variables, table):
+        """
+        Create a factor over `variables`, a tuple of person indices,
+        whose `table` has one axis of the three gene counts per variable.
+        """
+        self.variables = tuple(variables)
+        self.table = np.asarray(table, dtype=float)
+
+
+def transmission(probs):
+    """
+    Return the probability that a parent with 0, 1 or 2 copies of the
+    gene passes one on to a child, as `joint_probability` computes it.
+    """
+    mutation = probs["mutation"]
+    return np.array([mutation, (1 - mutation) * 0.5, 1 - mutation])
+
+
+def trait_likelihood(probs):
+    """
+    Return a (3, 2) array of the probability of not having (column 0)
+    and having (column 1) the trait for each gene count.
+    """
+    return np.array([
+        [probs["trait"][genes][False], probs["trait"][genes][True]]
+        for genes in range(3)
+    ])
+
+
+def inheritance(probs):
+    """
+    Return a (3, 3, 3) array of the probability of a child's gene count
+    (last axis) given their mother's and father's gene counts.
+    """
+    passes = transmission(probs)
+    mother = passes[:, None]
+    father = passes[None, :]
+    return np.stack([
+        (1 - mother) * (1 - father),
+        mother * (1 - father) + father * (1 - mother),
+        mother * father
+    ], axis=-1)
+
+
+def pedigree_factors(people, probs):
+    """
+    Return (names, factors) for the family `people`, as loaded by
+    `load_data`, under the probabilities `probs`.
+
+    Each person's gene count is a variable, numbered by their position
+    in `names`. Every person gets one factor: the unconditional gene
+    distribution for people without parents, or else the distribution
+    given their parents' gene counts (a missing parent counts as having
+    no copies, as in `joint_probability`). A known trait is evidence,
+    multiplied into the person's factor as the likelihood of that
+    trait given their gene count; an unknown trait sums to one and is
+    left out.
+    """
+    names = list(people)
+    index = {name: i for i, name in enumerate(names)}
+    likelihood = trait_likelihood(probs)
+    prior = np.array([probs["gene"][genes] for genes in range(3)])
+    child = inheritance(probs)
+
+    factors = []
+    for i, name in enumerate(names):
+        person = people[name]
+        trait = person["trait"]
+        evidence = likelihood[:, int(trait)] if trait is not None else np.ones(3)
+        mother = person["mother"]
+        father = person["father"]
+        if mother is None and father is None:
+            factors.append(Factor((i,), prior * evidence))
+            continue
+
+        table = child * evidence
+        variables = [i]
+        if father is None:
+            table = table[:, 0]
+        else:
+            variables.insert(0, index[father])
+        if mother is None:
+            table = table[0]
+        else:
+            variables.insert(0, index[mother])
+        factors.append(Factor(variables, table))
+    return names, factors
+
+
+def encode(people):
+    """
+    Return (names, mothers, fathers, traits) arrays describing the
+    family `people`: each person's mother's and father's index (-1 when
+    missing) and known trait (1 or 0, -1 when unknown).
+    """
+    names = list(people)
+    index = {name: i for i, name in enumerate(names)}
+    mothers = np.array([index.get(people[name]["mother"], -1) for name in names], dtype=np.int64)
+    fathers = np.array([index.get(people[name]["father"], -1) for name in names], dtype=np.int64)
+    traits = np.array([
+        -1 if people[name]["trait"] is None else int(people[name]["trait"]) for name in names
+    ], dtype=np.int64)
+    return names, mothers, fathers, traits
+
+
+def log_joint(mothers, fathers, genes, traits, probs):
+    """
+    Return the log joint probability of each of a batch of assignments,
+    for a family encoded by `encode`.
+
+    `genes` is a (batch, people) array of gene counts and `traits` a
+    (batch, people) array of 0 or 1 for each person's trait. Every
+    person's terms of `joint_probability`, for each combination of
+    their parents' genes, their own genes and trait, are tabulated as
+    logarithms once; each assignment then looks up one entry per
+    person and adds them, which cannot underflow however large the
+    family. Impossible assignments get -inf.
+    """
+    with np.errstate(divide="ignore"):
+        log_prior = np.log([probs["gene"][count] for count in range(3)])
+        log_child = np.log(inheritance(probs))
+        log_trait = np.log(trait_likelihood(probs))
+
+    # Indexed by person, mother's genes, father's genes, genes, trait
+    founders = (mothers < 0) & (fathers < 0)
+    table = np.where(
+        founders[:, None, None, None, None],
+        log_prior[None, None, None, :, None],
+        log_child[None, :, :, :, None]
+    ) + log_trait[None, None, None, :, :]
+
+    # A missing parent counts as having no copies of the gene
+    mother_genes = np.where(mothers >= 0, genes[:, np.maximum(mothers, 0)], 0)
+    father_genes = np.where(fathers >= 0, genes[:, np.maximum(fathers, 0)], 0)
+    index = (((mother_genes * 3 + father_genes) * 3 + genes) * 2 + traits
+             + np.arange(len(mothers)) * 54)
+    return table.reshape(-1)[index].sum(axis=1)
+
+
+def enumerate_marginals(people, probs, batch=ENUMERATION_BATCH):
+    """
+    Return the gene and trait distribution of every person in `people`,
+    in the format of `heredity.main`'s `probabilities`, by enumerating
+    every assignment of gene counts and unknown traits.
+
+    Assignments are numbered and decoded `batch` at a time into integer
+    arrays, their probabilities computed by `log_joint`, and added into
+    each person's distributions. Sums are kept relative to the largest
+    log probability seen so far, so the largest term is always 1.
+    """
+    names, mothers, fathers, known = encode(people)
+    n = len(names)
+    unknown = np.flatnonzero(known < 0)
+    total = 3 ** n * 2 ** len(unknown)
+
+    # Place value of each person's trait bit and gene digit in the numbering
+    trait_places = 2 ** np.arange(len(unknown), dtype=np.int64)
+    gene_places = 2 ** len(unknown) * 3 ** np.arange(n, dtype=np.int64)
+    offsets = 3 * np.arange(n)
+
+    shift = -np.inf
+    gene_sums = np.zeros(3 * n)
+    trait_sums = np.zeros(n)
+    for start in range(0, total, batch):
+        numbers = np.arange(start, min(start + batch, total), dtype=np.int64)[:, None]
+        genes = (numbers // gene_places % 3).astype(np.int32)
+        traits = np.tile(np.maximum(known, 0).astype(np.int32), (len(numbers), 1))
+        traits[:, unknown] = numbers // trait_places % 2
+
+        log_p = log_joint(mothers, fathers, genes, traits, probs)
+        largest = log_p.max()
+        if largest == -np.inf:
+            continue
+        if largest > shift:
+            gene_sums *= np.exp(shift - largest)
+            trait_sums *= np.exp(shift - largest)
+            shift = largest
+        weights = np.exp(log_p - shift)
+        gene_sums += np.bincount(
+            (genes + offsets).ravel(), weights=np.repeat(weights, n), minlength=3 * n
+        )
+        trait_sums += weights @ traits
+
+    if shift == -np.inf:
+        raise Exception("Evidence has zero probability")
+    gene_sums = gene_sums.reshape(n, 3)
+    totals = gene_sums.sum(axis=1)
+    probabilities = {}
+    for i, name in enumerate(names):
+        has_trait = trait_sums[i] / totals[i] if known[i] < 0 else float(known[i])
+        probabilities[name] = {
+            "gene": {count: gene_sums[i, count] / totals[i] for count in (2, 1, 0)},
+            "trait": {True: has_trait, False: 1 - has_trait}
+        }
+    return probabilities
+
+
+def multiply(factors, keep):
+    """
+    Return the product of `factors` summed over every variable not in
+    `keep`, as a new factor over the kept variables.
+
+    More than MAX_OPERANDS factors are multiplied a group at a time,
+    each group keeping the variables still needed by the others.
+    """
+    factors = list(factors)
+    while len(factors) > MAX_OPERANDS:
+        group = factors[:MAX_OPERANDS]
+        factors = factors[MAX_OPERANDS:]
+        needed = set(keep).union(*(factor.variables for factor in factors))
+        factors.append(multiply(group, needed))
+
+    letters = {}
+    for factor in factors:
+        for variable in factor.variables:
+            letters.setdefault(variable, AXES[len(letters)])
+    variables = [variable for variable in letters if variable in keep]
+    subscripts = ",".join(
+        "".join(letters[variable] for variable in factor.variables) for factor in factors
+    )
+    output = "".join(letters[variable] for variable in variables)
+    table = np.einsum(
+        f"{subscripts}->{output}", *(factor.table for factor in factors)
+    )
+    return Factor(variables, table)
+
+
+def interaction_graph(factors):
+    """
+    Return a dictionary mapping each variable of `factors` to the set of
+    variables it shares a factor with.
+    """
+    neighbors = {}
+    for factor in factors:
+        for variable in factor.variables:
+            neighbors.setdefault(variable, set()).update(factor.variables)
+    for variable in neighbors:
+        neighbors[variable].discard(variable)
+    return neighbors
+
+
+def min_fill_order(neighbors):
+    """
+    Return (order, width): an elimination order for the variables of
+    the interaction graph `neighbors`, and the most variables in any
+    factor it creates. Variables are taken greedily, first the one
+    whose elimination would connect the fewest unconnected pairs of
+    its neighbors, then the one with the fewest neighbors.
+
+    Scores are kept in a heap. Eliminating a variable can only change
+    the scores of its neighbors and their neighbors, which are pushed
+    again; stale entries are recognised and dropped when popped.
+    """
+    neighbors = {variable: set(adjacent) for variable, adjacent in neighbors.items()}
+
+    def score(variable):
+        adjacent = list(neighbors[variable])
+        fill = sum(
+            1
+            for i, first in enumerate(adjacent)
+            for second in adjacent[i + 1:]
+            if second not in neighbors[first]
+        )
+        return (fill, len(adjacent), variable)
+
+    heap = [score(variable) for variable in neighbors]
+    heapq.heapify(heap)
+    order = []
+    width = 0
+    while heap:
+        entry = heapq.heappop(heap)
+        variable = entry[-1]
+        if variable not in neighbors or entry != score(variable):
+            continue
+        order.append(variable)
+        width = max(width, len(neighbors[variable]))
+
+        # Connect the neighbors to each other, then remove the variable
+        adjacent = neighbors.pop(variable)
+        for first in adjacent:
+            neighbors[first].discard(variable)
+            neighbors[first].update(adjacent - {first})
+        affected = set(adjacent)
+        for first in adjacent:
+            affected.update(neighbors[first])
+        for other in affected:
+            heapq.heappush(heap, score(other))
+    return order, width
+
+
+def eliminate(factors, order, query):
+    """
+    Return the distribution of variable `query` given the evidence in
+    `factors`, by summing out every other variable in `order`.
+
+    Each new factor is rescaled so its largest entry is 1. The lost
+    constant is common to every value of `query`, so the distribution is
+    unchanged, and long products of small probabilities cannot
+    underflow.
+    """
+    containing = {}
+    for number, factor in enumerate(factors):
+        for variable in factor.variables:
+            containing.setdefault(variable, set()).add(number)
+    factors = dict(enumerate(factors))
+    following = len(factors)
+
+    for variable in order:
+        if variable == query or variable not in containing:
+            continue
+        numbers = containing.pop(variable)
+        chosen = [factors.pop(number) for number in numbers]
+        keep = set().union(*(factor.variables for factor in chosen)) - {variable}
+        product = multiply(chosen, keep)
+        largest = product.table.max()
+        if largest > 0:
+            product.table /= largest
+        factors[following] = product
+        for other in product.variables:
+            containing[other] -= numbers
+            containing[other].add(following)
+        following += 1
+
+    # Factors left without the query only scale the result
+    if query not in containing:
+        raise Exception(f"Variable {query} is in no factor")
+    result = multiply([factors[number] for number in containing[query]], {query})
+    total = result.table.sum()
+    if total == 0:
+        raise Exception("Evidence has zero probability")
+    return result.table / total
+
+
+def marginals(people, probs):
+    """
+    Return the gene and trait distribution of every person in `people`
+    given the known traits, in the format of `heredity.main`'s
+    `probabilities`, by variable elimination.
+
+    The pedigree is compiled into factors once, and one min-fill
+    elimination order over all gene variables is shared by every
+    person's query, skipping that person's own variable. A person's
+    trait distribution follows from their gene distribution, or is
+    certain when the trait is known.
+    """
+    names, factors = pedigree_factors(people, probs)
+    order, width = min_fill_order(interaction_graph(factors))
+    if width > MAX_WIDTH:
+        raise Exception(
+            f"Pedigree too interconnected for exact inference: "
+            f"elimination needs factors over {width} people"
+        )
+    likelihood = trait_likelihood(probs)
+
+    probabilities = {}
+    for i, name in enumerate(names):
+        genes = eliminate(factors, order, i)
+        trait = people[name]["trait"]
+        if trait is None:
+            has_trait = float(genes @ likelihood[:, 1])
+        else:
+            has_trait = float(trait)
+        probabilities[name] = {
+            "gene": {2: float(genes[2]), 1: float(genes[1]), 0: float(genes[0])},
+            "trait": {True: has_trait, False: 1 - has_trait}
+        }
+    return probabilities
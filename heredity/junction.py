@@ -0,0 +1,256 @@
+import hashlib
+import pickle
+
+import numpy as np
+
+import inference
+
+JUNCTION_SUFFIX = ".junction"
+JUNCTION_VERSION = 1
+
+
+class JunctionTree():
+
+    def __init__(self, names, families, cliques, parents, homes):
+        """
+        Create a junction tree over the gene variables of a family.
+
+        `names` lists the people, `families` gives each person's
+        (mother, father) indices (None when missing), and `cliques`
+        lists the variables of every clique. `parents` gives each
+        clique's parent clique (-1 for a root), always later in the
+        list, and its separator is its variables except the first.
+        `homes` gives the clique each person's family factor is
+        multiplied into.
+        """
+        self.names = names
+        self.families = families
+        self.cliques = cliques
+        self.parents = parents
+        self.homes = homes
+
+    @classmethod
+    def compile(cls, people):
+        """
+        JunctionTree.compile(people) builds the tree for the family
+        `people` from their mother and father links alone.
+
+        Eliminating the gene variables in min-fill order creates one
+        clique per variable: the variable and its neighbors when it is
+        eliminated. Its parent is the clique of whichever of those
+        neighbors is eliminated next, which makes the cliques a
+        junction tree with those neighbors as separator. Each family
+        factor goes to the clique of its first eliminated person, which
+        holds the rest of the family too.
+        """
+        names = list(people)
+        index = {name: i for i, name in enumerate(names)}
+        families = [
+            tuple(index[parent] if parent is not None else None
+                  for parent in (people[name]["mother"], people[name]["father"]))
+            for name in names
+        ]
+        neighbors = {i: set() for i in range(len(names))}
+        for child, family in enumerate(families):
+            members = [parent for parent in family if parent is not None] + [child]
+            for member in members:
+                neighbors[member].update(members)
+        for i in neighbors:
+            neighbors[i].discard(i)
+
+        order, width = inference.min_fill_order(neighbors)
+        if width > inference.MAX_WIDTH:
+            raise Exception(
+                f"Pedigree too interconnected for exact inference: "
+                f"cliques need {width + 1} people"
+            )
+        position = {variable: k for k, variable in enumerate(order)}
+
+        # Replay the elimination to find each variable's neighbors
+        cliques = []
+        parents = []
+        for variable in order:
+            adjacent = sorted(neighbors[variable], key=position.get)
+            cliques.append((variable,) + tuple(adjacent))
+            parents.append(position[adjacent[0]] if adjacent else -1)
+            for first in adjacent:
+                neighbors[first].discard(variable)
+                neighbors[first].update(other for other in adjacent if other != first)
+            del neighbors[variable]
+
+        homes = [
+            min(position[member] for member in family + (child,) if member is not None)
+            for child, family in enumerate(families)
+        ]
+        return cls(names, families, cliques, parents, homes)
+
+    @classmethod
+    def load(cls, filename, people):
+        """
+        JunctionTree.load(filename, people) returns the tree for the
+        family `people` loaded from `filename`, reusing the one compiled
+        into the cache file beside it if the family's mother and father
+        links have not changed, and compiling and caching it otherwise.
+        """
+        key = structure_key(people)
+        path = filename + JUNCTION_SUFFIX
+        try:
+            with open(path, "rb") as f:
+                cached = pickle.load(f)
+            if cached.get("version") == JUNCTION_VERSION and cached.get("key") == key:
+                return cls(**cached["tree"])
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, TypeError):
+            pass
+
+        tree = cls.compile(people)
+        try:
+            with open(path, "wb") as f:
+                pickle.dump({
+                    "version": JUNCTION_VERSION,
+                    "key": key,
+                    "tree": {
+                        "names": tree.names,
+                        "families": tree.families,
+                        "cliques": tree.cliques,
+                        "parents": tree.parents,
+                        "homes": tree.homes
+                    }
+                }, f, pickle.HIGHEST_PROTOCOL)
+        except OSError:
+            pass
+        return tree
+
+    def calibrate(self, probs, evidence):
+        """
+        Return one `probabilities` dictionary, as `heredity.main`
+        prints, for each entry of `evidence`: a dictionary mapping
+        people to their known trait (True, False or None).
+
+        All evidence sets are calibrated together, every table carrying
+        a leading axis with one entry per set. Messages are passed from
+        the leaves to the roots and back (Hugin style: a message down is
+        divided by the one sent up), after which each clique holds the
+        joint distribution of its variables, from which each person's
+        gene distribution is summed. Beliefs are rescaled after every
+        update so their largest entry is 1, so they cannot underflow.
+        """
+        batch = len(evidence)
+        likelihood = inference.trait_likelihood(probs)
+        prior = np.array([probs["gene"][genes] for genes in range(3)])
+        child = inference.inheritance(probs)
+
+        beliefs = [np.ones((batch,) + (3,) * len(clique)) for clique in self.cliques]
+        for person, name in enumerate(self.names):
+            weights = np.ones((batch, 3))
+            for row, traits in enumerate(evidence):
+                trait = traits.get(name)
+                if trait is not None:
+                    weights[row] = likelihood[:, int(trait)]
+            mother, father = self.families[person]
+            if mother is None and father is None:
+                variables = (person,)
+                table = prior * weights
+            else:
+                table = child[None] * weights[:, None, None, :]
+                variables = (person,)
+                if father is None:
+                    table = table[:, :, 0]
+                else:
+                    variables = (father,) + variables
+                if mother is None:
+                    table = table[:, 0]
+                else:
+                    variables = (mother,) + variables
+            home = self.homes[person]
+            beliefs[home] = contract(
+                [(self.cliques[home], beliefs[home]), (variables, table)], self.cliques[home]
+            )
+
+        # Leaves to roots, keeping each message for the way back
+        messages = [None] * len(self.cliques)
+        for k, parent in enumerate(self.parents):
+            if parent < 0:
+                continue
+            separator = self.cliques[k][1:]
+            messages[k] = rescale(contract([(self.cliques[k], beliefs[k])], separator))
+            beliefs[parent] = rescale(contract(
+                [(self.cliques[parent], beliefs[parent]), (separator, messages[k])],
+                self.cliques[parent]
+            ))
+
+        # Roots to leaves
+        for k in reversed(range(len(self.cliques))):
+            parent = self.parents[k]
+            if parent < 0:
+                continue
+            separator = self.cliques[k][1:]
+            down = contract([(self.cliques[parent], beliefs[parent])], separator)
+            down = np.divide(down, messages[k], out=np.zeros_like(down), where=messages[k] > 0)
+            beliefs[k] = rescale(contract(
+                [(self.cliques[k], beliefs[k]), (separator, down)], self.cliques[k]
+            ))
+
+        genes = np.zeros((batch, len(self.names), 3))
+        for k, clique in enumerate(self.cliques):
+            genes[:, clique[0]] = contract([(clique, beliefs[k])], clique[:1])
+        totals = genes.sum(axis=2, keepdims=True)
+        if (totals == 0).any():
+            raise Exception("Evidence has zero probability")
+        genes /= totals
+
+        results = []
+        for row, traits in enumerate(evidence):
+            probabilities = {}
+            for person, name in enumerate(self.names):
+                trait = traits.get(name)
+                if trait is None:
+                    has_trait = float(genes[row, person] @ likelihood[:, 1])
+                else:
+                    has_trait = float(trait)
+                distribution = genes[row, person]
+                probabilities[name] = {
+                    "gene": {2: float(distribution[2]), 1: float(distribution[1]),
+                             0: float(distribution[0])},
+                    "trait": {True: has_trait, False: 1 - has_trait}
+                }
+            results.append(probabilities)
+        return results
+
+
+def structure_key(people):
+    """
+    Return a hash of the mother and father links of `people`, the only
+    part of a family the junction tree depends on.
+    """
+    links = "\n".join(
+        f"{name},{person['mother'] or ''},{person['father'] or ''}"
+        for name, person in people.items()
+    )
+    return hashlib.sha256(links.encode("utf-8")).hexdigest()
+
+
+def contract(operands, variables):
+    """
+    Return the product of `operands`, (variables, table) pairs whose
+    tables have a leading batch axis, summed onto `variables`.
+    """
+    letters = {}
+    for operand_variables, _ in operands:
+        for variable in operand_variables:
+            letters.setdefault(variable, inference.AXES[len(letters)])
+    subscripts = ",".join(
+        "..." + "".join(letters[variable] for variable in operand_variables)
+        for operand_variables, _ in operands
+    )
+    output = "..." + "".join(letters[variable] for variable in variables)
+    return np.einsum(f"{subscripts}->{output}", *(table for _, table in operands))
+
+
+def rescale(table):
+    """
+    Divide each batch entry of `table` by its largest value, leaving
+    entries that are all zero alone.
+    """
+    largest = table.reshape(len(table), -1).max(axis=1)
+    largest[largest == 0] = 1
+    return table / largest.reshape((-1,) + (1,) * (table.ndim - 1))
@@ -0,0 +1,321 @@
+import multiprocessing
+import warnings
+
+import numpy as np
+
+import inference
+
+# Batches each chain's samples are split into for standard errors
+BATCHES = 20
+
+# Gibbs sweeps discarded before samples are kept
+BURN_IN = 100
+
+# Samples drawn together by likelihood weighting
+SAMPLE_BLOCK = 1 << 12
+
+# Effective sample size below which likelihood weighting warns that its
+# estimates and standard errors rest on too few samples
+MIN_EFFECTIVE_SAMPLES = 100
+
+METHODS = ["likelihood-weighting", "gibbs"]
+
+
+def topological_order(mothers, fathers):
+    """
+    Return the people of an encoded family ordered so parents come
+    before their children.
+    """
+    n = len(mothers)
+    placed = np.zeros(n, dtype=bool)
+    order = []
+    while len(order) < n:
+        ready = ~placed
+        ready &= (mothers < 0) | placed[np.maximum(mothers, 0)]
+        ready &= (fathers < 0) | placed[np.maximum(fathers, 0)]
+        if not ready.any():
+            raise Exception("Family has a cycle of parents")
+        order.extend(np.flatnonzero(ready))
+        placed |= ready
+    return order
+
+
+def tables(probs):
+    """
+    Return (prior, child, log_prior, log_child, log_trait) arrays for
+    `probs`, as in `inference`.
+    """
+    prior = np.array([probs["gene"][count] for count in range(3)])
+    child = inference.inheritance(probs)
+    with np.errstate(divide="ignore"):
+        return (prior, child, np.log(prior), np.log(child),
+                np.log(inference.trait_likelihood(probs)))
+
+
+def draw(rng, weights):
+    """
+    Return one gene count per row of `weights`, a (rows, 3) array of
+    unnormalized probabilities.
+    """
+    cumulative = np.cumsum(weights, axis=1)
+    thresholds = rng.random(len(weights)) * cumulative[:, -1]
+    return (thresholds[:, None] >= cumulative[:, :2]).sum(axis=1)
+
+
+def likelihood_weighting(family, probs, samples, seed):
+    """
+    Return BATCHES (shift, sums, weight, square) tuples estimating an
+    encoded `family`'s distributions by likelihood weighting.
+
+    Every sample draws each person's gene count from their parents' in
+    topological order, SAMPLE_BLOCK samples at a time, and is weighted
+    by the likelihood of the known traits. `sums` adds up the weights
+    of each person's gene counts (columns 0 to 2) and of having the
+    trait (column 3, from the gene count rather than sampled), `weight`
+    the total weight, both scaled by exp(-shift), and `square` the sum
+    of the squared weights, scaled by exp(-2 * shift).
+    """
+    _, mothers, fathers, known = family
+    prior, child, _, _, log_trait = tables(probs)
+    order = topological_order(mothers, fathers)
+    has_trait = np.exp(log_trait[:, 1])
+    rng = np.random.default_rng(seed)
+
+    results = []
+    for batch in np.array_split(np.arange(samples), BATCHES):
+        shift = -np.inf
+        sums = np.zeros((len(mothers), 4))
+        weight = 0.0
+        square = 0.0
+        for start in range(0, len(batch), SAMPLE_BLOCK):
+            count = min(SAMPLE_BLOCK, len(batch) - start)
+            genes = np.zeros((count, len(mothers)), dtype=np.int64)
+            log_weights = np.zeros(count)
+            for person in order:
+                mother = mothers[person]
+                father = fathers[person]
+                if mother < 0 and father < 0:
+                    weights = np.broadcast_to(prior, (count, 3))
+                else:
+                    weights = child[
+                        genes[:, mother] if mother >= 0 else 0,
+                        genes[:, father] if father >= 0 else 0
+                    ]
+                genes[:, person] = draw(rng, weights)
+                if known[person] >= 0:
+                    log_weights += log_trait[genes[:, person], known[person]]
+
+            largest = log_weights.max()
+            if largest == -np.inf:
+                continue
+            if largest > shift:
+                sums *= np.exp(shift - largest)
+                weight *= np.exp(shift - largest)
+                square *= np.exp(2 * (shift - largest))
+                shift = largest
+            weights = np.exp(log_weights - shift)
+            sums += tally(genes, known, has_trait, weights)
+            weight += weights.sum()
+            square += weights @ weights
+        results.append((shift, sums, weight, square))
+    return results
+
+
+def tally(genes, known, has_trait, weights):
+    """
+    Return a (people, 4) array of the `weights` of the samples `genes`
+    having each gene count, and of having the trait.
+    """
+    people = genes.shape[1]
+    sums = np.zeros((people, 4))
+    sums[:, :3] = np.bincount(
+        (genes + 3 * np.arange(people)).ravel(),
+        weights=np.repeat(weights, people), minlength=3 * people
+    ).reshape(people, 3)
+    sums[:, 3] = weights @ has_trait[genes]
+    sums[known >= 0, 3] = weights.sum() * known[known >= 0]
+    return sums
+
+
+def blocks(mothers, fathers):
+    """
+    Return lists of people no two of whom share a factor (a parent and
+    child, or two parents of one child), by greedy coloring, so each
+    list can be resampled at once in Gibbs sampling.
+    """
+    n = len(mothers)
+    neighbors = [set() for _ in range(n)]
+    for person in range(n):
+        family = [parent for parent in (mothers[person], fathers[person]) if parent >= 0]
+        family.append(person)
+        for member in family:
+            neighbors[member].update(family)
+    colors = np.full(n, -1)
+    for person in range(n):
+        used = {colors[other] for other in neighbors[person]}
+        color = 0
+        while color in used:
+            color += 1
+        colors[person] = color
+    return [np.flatnonzero(colors == color) for color in range(colors.max() + 1)]
+
+
+def gibbs(family, probs, samples, seed, burn_in=BURN_IN):
+    """
+    Return BATCHES (shift, sums, weight, square) tuples, as from
+    `likelihood_weighting`, estimating an encoded `family`'s
+    distributions from one blocked Gibbs chain of `samples` sweeps
+    after `burn_in`.
+
+    The chain starts from a forward sample and sweeps over `blocks`:
+    each block's people are conditionally independent given everyone
+    else, so all of them are redrawn at once from their own factor,
+    evidence, and their children's factors.
+    """
+    _, mothers, fathers, known = family
+    prior, child, log_prior, log_child, log_trait = tables(probs)
+    has_trait = np.exp(log_trait[:, 1])
+    rng = np.random.default_rng(seed)
+    n = len(mothers)
+    founders = (mothers < 0) & (fathers < 0)
+    evidence = np.zeros((n, 3))
+    evidence[known >= 0] = log_trait[:, known[known >= 0]].T
+
+    genes = np.zeros(n, dtype=np.int64)
+    for person in topological_order(mothers, fathers):
+        if founders[person]:
+            weights = prior
+        else:
+            weights = child[genes[mothers[person]] if mothers[person] >= 0 else 0,
+                            genes[fathers[person]] if fathers[person] >= 0 else 0]
+        genes[person] = draw(rng, weights[None])[0]
+
+    # Each block's links to children: (position in block, child, other
+    # parent, whether the person is the mother)
+    children = []
+    for block in blocks(mothers, fathers):
+        position = {person: k for k, person in enumerate(block)}
+        links = [
+            (position[parent], person, other, parent == mothers[person])
+            for person in range(n)
+            for parent, other in ((mothers[person], fathers[person]),
+                                  (fathers[person], mothers[person]))
+            if parent in position
+        ]
+        children.append((block, np.array(links, dtype=np.int64).reshape(-1, 4)))
+
+    def sweep():
+        for block, links in children:
+            mother_genes = np.where(mothers[block] >= 0, genes[np.maximum(mothers[block], 0)], 0)
+            father_genes = np.where(fathers[block] >= 0, genes[np.maximum(fathers[block], 0)], 0)
+            log_weights = np.where(
+                founders[block, None], log_prior[None], log_child[mother_genes, father_genes]
+            ) + evidence[block]
+            if len(links):
+                position, kids, others, is_mother = links.T
+                other_genes = np.where(others >= 0, genes[np.maximum(others, 0)], 0)
+                terms = np.where(
+                    is_mother[:, None] == 1,
+                    log_child[:, other_genes, genes[kids]].T,
+                    log_child[other_genes, :, genes[kids]]
+                )
+                np.add.at(log_weights, position, terms)
+            log_weights -= log_weights.max(axis=1, keepdims=True)
+            genes[block] = draw(rng, np.exp(log_weights))
+
+    for _ in range(burn_in):
+        sweep()
+    results = []
+    for batch in np.array_split(np.arange(samples), BATCHES):
+        kept = np.zeros((len(batch), n), dtype=np.int64)
+        for k in range(len(batch)):
+            sweep()
+            kept[k] = genes
+        results.append((0.0, tally(kept, known, has_trait, np.ones(len(batch))),
+                        float(len(batch)), float(len(batch))))
+    return results
+
+
+def chain(method, family, probs, samples, seed):
+    """
+    Run one chain of `method` and return its batches.
+    """
+    if method == "likelihood-weighting":
+        return likelihood_weighting(family, probs, samples, seed)
+    if method == "gibbs":
+        return gibbs(family, probs, samples, seed)
+    raise Exception(f"Unknown sampling method: {method}")
+
+
+def estimate(people, probs, method, samples, chains=1, seed=None, workers=None):
+    """
+    Return (probabilities, errors): the gene and trait distribution of
+    every person in `people`, in the format of `heredity.main`'s
+    `probabilities`, estimated by `method` from `samples` samples split
+    among `chains` independent chains, and the standard error of each
+    estimate in the same format.
+
+    Chains are seeded from `seed` and run in a pool of `workers`
+    processes (default: one per CPU). Estimates pool every chain's
+    BATCHES batches by their total weight, and standard errors are
+    those of that ratio estimator: the spread of the batch estimates
+    around the pooled one, each weighted by its batch's share of the
+    total weight (the delta method).
+
+    Likelihood weighting warns when the effective sample size of its
+    weights, (sum of weights) ** 2 / (sum of squared weights), falls
+    below MIN_EFFECTIVE_SAMPLES. A few samples then carry nearly all
+    the weight, so the estimates cannot be trusted and their standard
+    errors are reported as NaN.
+    """
+    family = inference.encode(people)
+    names = family[0]
+    seeds = np.random.SeedSequence(seed).spawn(chains)
+    per_chain = -(-samples // chains)
+    tasks = [(method, family, probs, per_chain, child) for child in seeds]
+    workers = min(workers or multiprocessing.cpu_count(), chains)
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            runs = pool.starmap(chain, tasks)
+    else:
+        runs = [chain(*task) for task in tasks]
+
+    batches = [batch for run in runs for batch in run if batch[2] > 0]
+    if not batches:
+        raise Exception("Every sample had zero weight")
+    shift = max(batch[0] for batch in batches)
+    scales = np.array([np.exp(batch[0] - shift) for batch in batches])
+    sums = np.array([batch[1] for batch in batches]) * scales[:, None, None]
+    weights = np.array([batch[2] for batch in batches]) * scales
+    means = sums.sum(axis=0) / weights.sum()
+    errors = np.full_like(means, np.nan)
+    if len(batches) > 1:
+        # Each batch's share of the weight times its deviation from the
+        # pooled estimate, without dividing by weights that may underflow
+        deviations = (sums - means * weights[:, None, None]) / weights.sum()
+        errors = np.sqrt(len(batches) / (len(batches) - 1) * (deviations ** 2).sum(axis=0))
+
+    if method == "likelihood-weighting":
+        squares = sum(batch[3] * scale ** 2 for batch, scale in zip(batches, scales))
+        effective = weights.sum() ** 2 / squares
+        if effective < MIN_EFFECTIVE_SAMPLES:
+            errors[:] = np.nan
+            warnings.warn(
+                f"Likelihood weighting kept an effective sample size of "
+                f"{effective:.1f} out of {samples} samples; its estimates and "
+                f"standard errors are unreliable (try --method gibbs)",
+                RuntimeWarning
+            )
+
+    probabilities = {}
+    standard_errors = {}
+    for i, name in enumerate(names):
+        probabilities[name] = {
+            "gene": {count: float(means[i, count]) for count in (2, 1, 0)},
+            "trait": {True: float(means[i, 3]), False: float(1 - means[i, 3])}
+        }
+        standard_errors[name] = {
+            "gene": {count: float(errors[i, count]) for count in (2, 1, 0)},
+            "trait": {True: float(errors[i, 3]), False: float(errors[i, 3])}
+        }
+    return probabilities, standard_errors
@@ -0,0 +1,275 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import crawler
+import pagerank
+import partitioned
+from edgestore import EdgeStore, read_edges
+from graph import LinkGraph
+
+GENERATORS = ["erdos-renyi", "power-law", "dangling"]
+
+# Mean links out of each page
+DEGREE = 8
+
+# Shape of the Pareto out-degrees of power-law graphs, and the exponent
+# skewing their targets toward low page ids (in-degree falls off as a
+# power of the id)
+POWER_LAW_SHAPE = 1.5
+TARGET_SKEW = 3
+
+# Share of pages without links in dangling-heavy graphs
+DANGLING_FRACTION = 0.5
+
+# Pages generated at a time
+GENERATE_PAGES = 1 << 18
+
+# Largest graphs written as HTML and crawled, sampled, and solved in
+# memory; larger graphs are only written as edge lists for the edge store
+HTML_MAX_PAGES = 10 ** 5
+SAMPLE_MAX_PAGES = 10 ** 5
+MEMORY_MAX_PAGES = 10 ** 6
+
+# Samples drawn per page by sample_pagerank
+SAMPLES_PER_PAGE = 100
+
+# Largest L1 distance from the reference ranks that counts as agreeing,
+# for solvers run to TOLERANCE and for sampling
+AGREEMENT = 1e-6
+SAMPLE_AGREEMENT = 0.25
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks for PageRank on synthetic graphs."
+    )
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6],
+        help="page counts to generate (up to 10 ** 7)"
+    )
+    parser.add_argument("--generators", choices=GENERATORS, nargs="+", default=GENERATORS)
+    parser.add_argument("--damping", type=float, default=pagerank.DAMPING)
+    parser.add_argument("--workers", type=int, default=2, help="processes for partitioned PageRank")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="directory for generated corpora (default: system temp)")
+    parser.add_argument("--output", help="write the results to this file as JSON")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'generator':<13}{'pages':>10}{'links':>11}  {'stage':<18}{'seconds':>9}{'iters':>7}{'L1':>10}")
+    for pages in args.sizes:
+        for kind in args.generators:
+            work = tempfile.mkdtemp(prefix="pagerank-bench-", dir=args.workdir)
+            try:
+                for result in benchmark(kind, pages, args.damping, args.workers, args.seed, work):
+                    print(
+                        f"{kind:<13}{pages:>10}{result['links']:>11}  {result['stage']:<18}"
+                        f"{result['seconds']:>9.3f}{result.get('iterations', ''):>7}"
+                        f"{format(result['l1'], '.1e') if 'l1' in result else '':>10}"
+                        f"{'' if result.get('agrees', True) else '  DISAGREES'}"
+                    )
+                    results.append(result)
+            finally:
+                shutil.rmtree(work, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=1)
+    if not all(result.get("agrees", True) for result in results):
+        sys.exit("Some PageRank results disagree with the reference.")
+
+
+def environment():
+    """
+    Return a description of the machine and library versions the
+    results were measured with.
+    """
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count()
+    }
+
+
+def generate(kind, pages, seed, degree=DEGREE):
+    """
+    Yield (sources, targets) arrays of the links of a random graph of
+    `kind` on `pages` pages, GENERATE_PAGES source pages at a time.
+
+    "erdos-renyi" graphs give every page Poisson(`degree`) links to
+    uniformly random pages. "power-law" graphs have Pareto out-degrees
+    and targets concentrated on low page ids. "dangling" graphs leave
+    DANGLING_FRACTION of the pages without links and give the rest
+    more. Links are distinct and never point from a page to itself.
+    """
+    rng = np.random.default_rng(seed)
+    for start in range(0, pages, GENERATE_PAGES):
+        count = min(GENERATE_PAGES, pages - start)
+        if kind == "erdos-renyi":
+            out_degree = rng.poisson(degree, count)
+        elif kind == "power-law":
+            scale = degree * (POWER_LAW_SHAPE - 1) / POWER_LAW_SHAPE
+            out_degree = ((rng.pareto(POWER_LAW_SHAPE, count) + 1) * scale).astype(np.int64)
+        elif kind == "dangling":
+            out_degree = rng.poisson(degree / (1 - DANGLING_FRACTION), count)
+            out_degree[rng.random(count) < DANGLING_FRACTION] = 0
+        else:
+            raise Exception(f"Unknown generator: {kind}")
+        out_degree = np.minimum(out_degree, pages - 1)
+
+        sources = np.repeat(np.arange(start, start + count, dtype=np.int64), out_degree)
+        if kind == "power-law":
+            targets = (pages * rng.random(len(sources)) ** TARGET_SKEW).astype(np.int64)
+        else:
+            targets = rng.integers(pages, size=len(sources))
+        keys = np.unique(sources[sources != targets] * pages + targets[sources != targets])
+        yield keys // pages, keys % pages
+
+
+def adjacency(blocks):
+    """
+    Return a dictionary mapping each page id with links in `blocks` to
+    the list of page ids it links to.
+    """
+    links = {}
+    for sources, targets in blocks:
+        bounds = np.flatnonzero(np.diff(sources)) + 1
+        for group in np.split(np.arange(len(sources)), bounds):
+            if len(group):
+                links[int(sources[group[0]])] = targets[group].tolist()
+    return links
+
+
+def write_corpus(directory, pages, links):
+    """
+    Write the pages of a graph to `directory` as "<id>.html" files, each
+    linking to the pages listed for it in `links`.
+    """
+    for page in range(pages):
+        anchors = "".join(f'    <a href="{target}.html">{target}</a>\n' for target in links.get(page, []))
+        with open(os.path.join(directory, f"{page}.html"), "w") as f:
+            f.write(f"<!DOCTYPE html>\n<html>\n<body>\n{anchors}</body>\n</html>\n")
+
+
+def write_edges(path, blocks):
+    """
+    Write the links in `blocks` to `path` as a text edge list of
+    'source target' lines, returning the number of links.
+    """
+    count = 0
+    with open(path, "w") as f:
+        for sources, targets in blocks:
+            f.write("".join(f"{s} {t}\n" for s, t in zip(sources.tolist(), targets.tolist())))
+            count += len(sources)
+    return count
+
+
+def by_id(ranks):
+    """
+    Return the ranks from a dictionary over "<id>.html" pages as an
+    array indexed by page id.
+    """
+    array = np.zeros(len(ranks))
+    for page, rank in ranks.items():
+        array[int(page[:-len(".html")])] = rank
+    return array
+
+
+def benchmark(kind, pages, damping_factor, workers, seed, work):
+    """
+    Yield a result dictionary for every stage run on a `kind` graph of
+    `pages` pages, generated into the directory `work`.
+
+    Every graph is written as an edge list and ranked by the edge
+    store. Graphs up to MEMORY_MAX_PAGES are also ranked by each
+    LinkGraph solver and by partitioned PageRank, and those up to
+    HTML_MAX_PAGES are written as HTML, crawled (with a cold and then a
+    warm link cache) and ranked by `iterate_pagerank` and
+    `sample_pagerank`. Rankings are compared by L1 distance with the
+    in-memory power iteration result, when there is one.
+    """
+    def timed(stage, function, *args, **kwargs):
+        start = time.perf_counter()
+        value = function(*args, **kwargs)
+        return value, {
+            "generator": kind, "pages": pages, "links": links, "stage": stage,
+            "seconds": time.perf_counter() - start
+        }
+
+    def compare(result, ranks, tolerance=AGREEMENT):
+        if reference is not None:
+            result["l1"] = float(np.abs(np.asarray(ranks) - reference).sum())
+            result["agrees"] = result["l1"] <= tolerance
+        return result
+
+    reference = None
+    links = 0
+    path = os.path.join(work, "edges.txt")
+    links, result = timed("write edges", write_edges, path, generate(kind, pages, seed))
+    result["links"] = links
+    yield result
+
+    if pages <= MEMORY_MAX_PAGES:
+        sources, targets = (np.concatenate(arrays) for arrays in zip(*generate(kind, pages, seed)))
+        graph, result = timed("build graph", LinkGraph, range(pages), sources, targets)
+        yield result
+        (reference, iterations), result = timed("power", graph.power_iteration, damping_factor)
+        yield dict(result, iterations=iterations)
+        for method in ["aitken", "quadratic"]:
+            (ranks, iterations), result = timed(
+                method, graph.power_iteration, damping_factor, extrapolation=method
+            )
+            yield compare(dict(result, iterations=iterations), ranks)
+        (ranks, iterations), result = timed("gauss-seidel", graph.gauss_seidel, damping_factor)
+        yield compare(dict(result, iterations=iterations), ranks)
+        (ranks, iterations), result = timed(
+            f"partitioned x{workers}", partitioned.partitioned_pagerank,
+            graph, damping_factor, workers
+        )
+        yield compare(dict(result, iterations=iterations), ranks)
+        del graph
+
+        if pages <= HTML_MAX_PAGES:
+            directory = os.path.join(work, "html")
+            os.makedirs(directory)
+            _, result = timed(
+                "write html", write_corpus, directory, pages, adjacency([(sources, targets)])
+            )
+            yield result
+            corpus, result = timed("crawl", crawler.crawl, directory)
+            yield result
+            corpus, result = timed("crawl cached", crawler.crawl, directory)
+            yield result
+            ranks, result = timed("iterate_pagerank", pagerank.iterate_pagerank, corpus, damping_factor)
+            yield compare(result, by_id(ranks))
+            if pages <= SAMPLE_MAX_PAGES:
+                ranks, result = timed(
+                    "sample_pagerank", pagerank.sample_pagerank,
+                    corpus, damping_factor, SAMPLES_PER_PAGE * pages, seed=seed
+                )
+                yield compare(result, by_id(ranks), SAMPLE_AGREEMENT)
+            del corpus
+        del sources, targets
+
+    store, result = timed(
+        "edgestore build", EdgeStore.build, read_edges(path),
+        os.path.join(work, "store"), pages=pages, workdir=work
+    )
+    yield result
+    (ranks, iterations), result = timed("edgestore rank", store.power_iteration, damping_factor)
+    yield compare(dict(result, iterations=iterations), ranks)
+    del ranks, store
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import multiprocessing
+import os
+import pickle
+import re
+import time
+
+CACHE_FILENAME = "pagerank.cache"
+CACHE_VERSION = 1
+
+LINK = re.compile(r"<a\s+(?:[^>]*?)href=\"([^\"]*)\"")
+
+# Characters read from a page at a time
+CHUNK_SIZE = 1 << 16
+
+# Longest unfinished tag carried over between chunks
+MAX_TAG = 1 << 16
+
+# Fewer changed files than this are parsed without starting a pool
+POOL_MIN_FILES = 64
+
+
+class Timer():
+
+    def __init__(self, out=None):
+        """
+        Time crawl phases and report them to `out`, if given.
+        """
+        self.out = out
+        self.start = time.perf_counter()
+        self.phase_start = self.start
+
+    def phase(self, name, count, unit="files"):
+        now = time.perf_counter()
+        elapsed = now - self.phase_start
+        self.phase_start = now
+        if self.out is not None:
+            print(f"{name}: {count} {unit} in {elapsed:.3f}s", file=self.out)
+
+    def done(self, pages):
+        if self.out is not None:
+            elapsed = time.perf_counter() - self.start
+            print(f"Crawled {pages} pages in {elapsed:.3f}s", file=self.out)
+
+
+def parse_links(path):
+    """
+    Return the sorted list of link targets found in the HTML file at
+    `path`, reading it a chunk at a time.
+
+    Text after the last complete link that could still begin one (from
+    the first "<a" on) is carried into the next chunk, up to MAX_TAG
+    characters.
+    """
+    links = set()
+    carry = ""
+    with open(path) as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            text = carry + chunk
+            end = 0
+            for match in LINK.finditer(text):
+                links.add(match.group(1))
+                end = match.end()
+            if not chunk:
+                break
+            start = text.find("<a", end)
+            carry = text[start:] if start >= 0 else text[max(end, len(text) - 1):]
+            if len(carry) > MAX_TAG:
+                start = carry.find("<a", 1)
+                carry = carry[start:] if start >= 0 else carry[-1:]
+    return sorted(links)
+
+
+def load_cache(directory):
+    """
+    Return the crawl cache saved in `directory`, or an empty one if
+    there is none or it cannot be read.
+    """
+    try:
+        with open(os.path.join(directory, CACHE_FILENAME), "rb") as f:
+            cache = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return {"version": CACHE_VERSION, "files": {}}
+    if not isinstance(cache, dict) or cache.get("version") != CACHE_VERSION:
+        return {"version": CACHE_VERSION, "files": {}}
+    return cache
+
+
+def save_cache(directory, cache):
+    """
+    Atomically write `cache` to the crawl cache file in `directory`,
+    ignoring directories that cannot be written to.
+    """
+    path = os.path.join(directory, CACHE_FILENAME)
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump(cache, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def crawl(directory, workers=None, cache=True, out=None):
+    """
+    Parse a directory of HTML pages and return a dictionary mapping each
+    page to the set of other pages in the corpus it links to.
+
+    Pages whose modification time and size match the cache in
+    `directory` reuse their cached links; the rest are parsed across
+    `workers` processes (default: one per CPU) and the cache is updated.
+    Per-phase timings are printed to `out`, if given.
+    """
+    timer = Timer(out)
+    stats = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith(".html") and entry.is_file():
+                stat = entry.stat()
+                stats[entry.name] = (stat.st_mtime_ns, stat.st_size)
+    timer.phase("scan", len(stats))
+
+    saved = load_cache(directory) if cache else {"version": CACHE_VERSION, "files": {}}
+    files = {}
+    changed = []
+    for filename, stat in stats.items():
+        entry = saved["files"].get(filename)
+        if entry is not None and entry[0] == stat:
+            files[filename] = entry
+        else:
+            changed.append(filename)
+    timer.phase("cache hits", len(files))
+
+    paths = [os.path.join(directory, filename) for filename in changed]
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(paths) >= POOL_MIN_FILES:
+        with multiprocessing.Pool(workers) as pool:
+            parsed = pool.map(parse_links, paths, chunksize=max(1, len(paths) // (4 * workers)))
+    else:
+        parsed = [parse_links(path) for path in paths]
+    for filename, links in zip(changed, parsed):
+        files[filename] = (stats[filename], links)
+    timer.phase("parse", len(changed))
+
+    # Only include links to other pages in the corpus
+    pages = {
+        filename: set(link for link in links if link in files and link != filename)
+        for filename, (_, links) in files.items()
+    }
+    timer.phase("link", sum(len(links) for links in pages.values()), "links")
+
+    if cache and (changed or len(files) != len(saved["files"])):
+        saved["files"] = files
+        save_cache(directory, saved)
+        timer.phase("save cache", len(files))
+    timer.done(len(pages))
+    return pages
@@ -0,0 +1,367 @@
+import argparse
+import io
+import json
+import os
+import shutil
+import tempfile
+import warnings
+
+import numpy as np
+
+from graph import MAX_ITERATIONS, TOLERANCE
+
+META = "meta.json"
+
+# Edges held in memory at a time while building or iterating
+BLOCK_EDGES = 1 << 22
+
+# Pages per block when sweeping rank vectors
+BLOCK_PAGES = 1 << 22
+
+# Bytes of edge-list text parsed at a time
+READ_BYTES = 1 << 22
+
+# Upper bound on destination buckets open at once while sorting
+MAX_BUCKETS = 256
+
+# Destinations sampled from each input block to place bucket boundaries
+SAMPLE_PER_BLOCK = 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Out-of-core PageRank over a memory-mapped edge list."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser(
+        "build", help="sort a text edge list of 'source target' page ids into a store"
+    )
+    build.add_argument("edges")
+    build.add_argument("store")
+    build.add_argument("--workdir", help="directory for temporary files (default: system temp)")
+
+    rank = subparsers.add_parser("rank", help="compute PageRank over a store")
+    rank.add_argument("store")
+    rank.add_argument("--damping", type=float, default=0.85)
+    rank.add_argument("--dtype", choices=["float64", "float32"], default="float64")
+    rank.add_argument("--tolerance", type=float, default=TOLERANCE)
+    rank.add_argument("--top", type=int, default=10, help="print the highest ranked pages")
+
+    args = parser.parse_args()
+    if args.command == "build":
+        store = EdgeStore.build(read_edges(args.edges), args.store, workdir=args.workdir)
+        print(f"Stored {store.edges} links between {store.n} pages")
+    else:
+        store = EdgeStore(args.store)
+        ranks, iterations = store.power_iteration(
+            args.damping, args.tolerance, dtype=np.dtype(args.dtype)
+        )
+        print(f"Converged after {iterations} iterations")
+        names = store.names()
+        for page in top(ranks, args.top):
+            name = names[page] if names is not None else page
+            print(f"  {name}: {ranks[page]:.6f}")
+
+
+class EdgeStore():
+
+    def __init__(self, directory):
+        """
+        Open the edge store in `directory` for reading.
+
+        Links are kept as two memory-mapped integer arrays, `src` and
+        `dst`, sorted by destination, beside each page's out-degree.
+        Duplicate links and links from a page to itself are not stored.
+        """
+        self.directory = directory
+        with open(os.path.join(directory, META)) as f:
+            meta = json.load(f)
+        self.n = meta["pages"]
+        self.edges = meta["edges"]
+        dtype = np.dtype(meta["index_dtype"])
+        self.src = self._map("src.bin", dtype, self.edges)
+        self.dst = self._map("dst.bin", dtype, self.edges)
+        self.degree = self._map("degree.bin", np.int64, self.n)
+
+    def _map(self, name, dtype, length):
+        if length == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(os.path.join(self.directory, name), dtype=dtype, mode="r", shape=(length,))
+
+    @classmethod
+    def build(cls, blocks, directory, pages=None, names=None, workdir=None):
+        """
+        EdgeStore.build(blocks, directory) writes a store from `blocks`,
+        an iterable of (sources, targets) integer array pairs, in
+        bounded memory.
+
+        Links are spooled to disk, split into buckets by destination
+        range, and each bucket is sorted and deduplicated in memory.
+        `pages` is the page count (default: one more than the largest
+        id) and `names`, if given, lists the name of every page.
+        """
+        os.makedirs(directory, exist_ok=True)
+        work = tempfile.mkdtemp(prefix="pagerank-", dir=workdir)
+        try:
+            # Spool raw links, find the page count and sample destinations
+            raw = os.path.join(work, "raw.bin")
+            total = 0
+            largest = -1
+            rng = np.random.default_rng(0)
+            samples = []
+            with open(raw, "wb") as f:
+                for sources, targets in blocks:
+                    pairs = np.empty((len(sources), 2), dtype=np.int64)
+                    pairs[:, 0] = sources
+                    pairs[:, 1] = targets
+                    if len(pairs):
+                        if pairs.min() < 0:
+                            raise Exception("Page ids must not be negative")
+                        largest = max(largest, int(pairs.max()))
+                        samples.append(rng.choice(pairs[:, 1], min(len(pairs), SAMPLE_PER_BLOCK)))
+                    pairs.tofile(f)
+                    total += len(pairs)
+            n = largest + 1 if pages is None else pages
+            if largest >= n:
+                raise Exception(f"Page id {largest} out of range for {n} pages")
+            dtype = np.dtype(np.int32 if n < 2 ** 31 else np.int64)
+
+            # Split links into buckets of destinations holding similar
+            # numbers of links, with boundaries at quantiles of the sample
+            count = max(1, min(MAX_BUCKETS, -(-2 * total // BLOCK_EDGES)))
+            boundaries = np.zeros(0, dtype=np.int64)
+            if samples:
+                quantiles = np.quantile(np.concatenate(samples), np.linspace(0, 1, count + 1)[1:-1])
+                boundaries = np.unique(np.ceil(quantiles).astype(np.int64))
+            count = len(boundaries) + 1
+            paths = [os.path.join(work, f"bucket{i}.bin") for i in range(count)]
+            files = [open(path, "wb") for path in paths]
+            try:
+                spooled = np.zeros((0, 2), dtype=np.int64)
+                if total:
+                    spooled = np.memmap(raw, dtype=np.int64, mode="r", shape=(total, 2))
+                for start in range(0, total, BLOCK_EDGES):
+                    pairs = np.asarray(spooled[start:start + BLOCK_EDGES])
+                    buckets = np.searchsorted(boundaries, pairs[:, 1], side="right")
+                    order = np.argsort(buckets, kind="stable")
+                    bounds = np.searchsorted(buckets[order], np.arange(count + 1))
+                    for i in range(count):
+                        if bounds[i] < bounds[i + 1]:
+                            pairs[order[bounds[i]:bounds[i + 1]]].tofile(files[i])
+                del spooled
+            finally:
+                for f in files:
+                    f.close()
+            os.remove(raw)
+
+            # Sort each bucket by destination, dropping duplicates and self-links
+            degree = np.zeros(0, dtype=np.int64)
+            if n:
+                degree = np.memmap(os.path.join(directory, "degree.bin"), dtype=np.int64, mode="w+", shape=(n,))
+            edges = 0
+            with open(os.path.join(directory, "src.bin"), "wb") as src, \
+                    open(os.path.join(directory, "dst.bin"), "wb") as dst:
+                for path in paths:
+                    pairs = np.fromfile(path, dtype=np.int64).reshape(-1, 2)
+                    os.remove(path)
+                    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+                    pairs = pairs[np.lexsort((pairs[:, 0], pairs[:, 1]))]
+                    distinct = np.ones(len(pairs), dtype=bool)
+                    distinct[1:] = (pairs[1:] != pairs[:-1]).any(axis=1)
+                    pairs = pairs[distinct]
+                    np.add.at(degree, pairs[:, 0], 1)
+                    pairs[:, 0].astype(dtype).tofile(src)
+                    pairs[:, 1].astype(dtype).tofile(dst)
+                    edges += len(pairs)
+            if n:
+                degree.flush()
+            else:
+                open(os.path.join(directory, "degree.bin"), "wb").close()
+            del degree
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
+
+        if names is not None:
+            with open(os.path.join(directory, "pages.txt"), "w", encoding="utf-8") as f:
+                for name in names:
+                    f.write(f"{name}\n")
+        with open(os.path.join(directory, META), "w") as f:
+            json.dump({"pages": n, "edges": edges, "index_dtype": dtype.name}, f)
+        return cls(directory)
+
+    @classmethod
+    def from_corpus(cls, corpus, directory, workdir=None):
+        """
+        EdgeStore.from_corpus(corpus, directory) stores the links of a
+        corpus as returned by `crawl`, with pages in sorted order.
+        """
+        pages = sorted(corpus)
+        index = {page: i for i, page in enumerate(pages)}
+        sources = [index[page] for page in pages for link in corpus[page]]
+        targets = [index[link] for page in pages for link in corpus[page]]
+        return cls.build(
+            [(np.array(sources, dtype=np.int64), np.array(targets, dtype=np.int64))],
+            directory, pages=len(pages), names=pages, workdir=workdir
+        )
+
+    def names(self):
+        """
+        Return the list of page names, or None if pages are plain ids.
+        """
+        path = os.path.join(self.directory, "pages.txt")
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return [line.rstrip("\n") for line in f]
+
+    def power_iteration(self, damping_factor, tolerance=TOLERANCE,
+                        max_iterations=MAX_ITERATIONS, dtype=np.float64, workdir=None):
+        """
+        Return (ranks, iterations) like `LinkGraph.power_iteration`,
+        with `ranks` a memory-mapped array of `dtype` in the store.
+
+        Every iteration streams the links in blocks of BLOCK_EDGES.
+        Each block gathers its sources' rank shares and, as the block
+        is sorted by destination, adds them into one contiguous slice of
+        the next rank vector. Page vectors are swept BLOCK_PAGES at a
+        time, and sums are accumulated in float64 even for float32 ranks.
+        """
+        workdir = workdir or self.directory
+        if self.n == 0:
+            return np.zeros(0, dtype=dtype), 0
+
+        def vector(name):
+            return np.memmap(os.path.join(workdir, name), dtype=dtype, mode="w+", shape=(self.n,))
+
+        names = ["ranks.bin", "ranks.next"]
+        ranks = vector(names[0])
+        following = vector(names[1])
+        shares = vector("shares.bin")
+        ranks[:] = 1 / self.n
+
+        for iteration in range(1, max_iterations + 1):
+            # Each page's share per link, and the rank held by dangling pages
+            dangling = 0.0
+            for start in range(0, self.n, BLOCK_PAGES):
+                block = ranks[start:start + BLOCK_PAGES].astype(np.float64)
+                degree = self.degree[start:start + BLOCK_PAGES]
+                dangling += block[degree == 0].sum()
+                shares[start:start + BLOCK_PAGES] = np.divide(
+                    block, degree, out=np.zeros_like(block), where=degree > 0
+                )
+
+            following[:] = 0
+            for start in range(0, self.edges, BLOCK_EDGES):
+                src = self.src[start:start + BLOCK_EDGES]
+                dst = self.dst[start:start + BLOCK_EDGES]
+                low = int(dst[0])
+                high = int(dst[-1]) + 1
+                sums = np.bincount(dst - low, weights=shares[src].astype(np.float64), minlength=high - low)
+                following[low:high] += sums
+
+            teleport = (1 - damping_factor + damping_factor * dangling) / self.n
+            change = 0.0
+            for start in range(0, self.n, BLOCK_PAGES):
+                block = damping_factor * following[start:start + BLOCK_PAGES].astype(np.float64) + teleport
+                change += np.abs(block - ranks[start:start + BLOCK_PAGES]).sum()
+                following[start:start + BLOCK_PAGES] = block
+            ranks, following = following, ranks
+            names.reverse()
+            if change <= tolerance:
+                break
+
+        total = sum(
+            ranks[start:start + BLOCK_PAGES].astype(np.float64).sum()
+            for start in range(0, self.n, BLOCK_PAGES)
+        )
+        for start in range(0, self.n, BLOCK_PAGES):
+            ranks[start:start + BLOCK_PAGES] /= total
+        ranks.flush()
+        del ranks, following, shares
+        os.remove(os.path.join(workdir, "shares.bin"))
+        os.replace(os.path.join(workdir, names[0]), os.path.join(workdir, "ranks.bin"))
+        if names[0] == "ranks.bin":
+            os.remove(os.path.join(workdir, "ranks.next"))
+        ranks = np.memmap(os.path.join(workdir, "ranks.bin"), dtype=dtype, mode="r+", shape=(self.n,))
+        return ranks, iteration
+
+
+def read_edges(path):
+    """
+    Yield (sources, targets) arrays from a text file of whitespace-
+    separated 'source target' page id pairs, READ_BYTES at a time.
+    Everything after a '#' on a line is skipped. Raises an exception on
+    a line that is not two integer page ids.
+    """
+    with open(path, "rb") as f:
+        carry = b""
+        line = 0
+        while True:
+            chunk = f.read(READ_BYTES)
+            text = carry + chunk
+            if chunk:
+                cut = text.rfind(b"\n") + 1
+                text, carry = text[:cut], text[cut:]
+            pairs = np.zeros((0, 2), dtype=np.int64)
+            if text.strip():
+                with warnings.catch_warnings():
+                    # A chunk of nothing but comments is not an error
+                    warnings.simplefilter("ignore", UserWarning)
+                    try:
+                        pairs = np.loadtxt(io.BytesIO(text), dtype=np.int64, comments="#", ndmin=2)
+                    except ValueError:
+                        pairs = None
+                if pairs is None or (pairs.size and pairs.shape[1] != 2):
+                    number, content = malformed_line(text)
+                    raise Exception(
+                        f"Malformed edge list {path}, line {line + number}: {content!r}"
+                    )
+                if not pairs.size:
+                    pairs = np.zeros((0, 2), dtype=np.int64)
+            line += text.count(b"\n")
+            yield pairs[:, 0], pairs[:, 1]
+            if not chunk:
+                return
+
+
+def malformed_line(text):
+    """
+    Return (number, line) for the first line of `text`, counting from
+    1, that is neither blank, a comment, nor two integer page ids.
+    """
+    for number, line in enumerate(text.split(b"\n"), 1):
+        tokens = line.split(b"#")[0].split()
+        if not tokens:
+            continue
+        if len(tokens) == 2:
+            try:
+                for token in tokens:
+                    int(token)
+                continue
+            except ValueError:
+                pass
+        return number, line.decode("utf-8", "replace")
+    return 0, ""
+
+
+def top(ranks, k):
+    """
+    Return the indices of the `k` highest ranks, highest first,
+    scanning `ranks` BLOCK_PAGES at a time.
+    """
+    best = np.zeros(0, dtype=np.int64)
+    for start in range(0, len(ranks), BLOCK_PAGES):
+        block = np.asarray(ranks[start:start + BLOCK_PAGES])
+        if len(block) > k:
+            candidates = np.argpartition(-block, k)[:k] + start
+        else:
+            candidates = np.arange(start, start + len(block))
+        best = np.concatenate([best, candidates])
+        if len(best) > k:
+            best = best[np.argsort(-np.asarray(ranks[best]), kind="stable")[:k]]
+    return best[np.argsort(-np.asarray(ranks[best]), kind="stable")]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,473 @@
+import math
+import time
+
+import numpy as np
+
+# Iteration stops once the L1 change of the rank vector falls below this
+TOLERANCE = 1e-8
+
+# Safety cap on power iterations
+MAX_ITERATIONS = 1000
+
+# Visits buffered by the sampler before they are tallied
+SAMPLE_BUFFER = 1 << 20
+
+# Bound on how far (in total variation) each surfer's distribution may
+# still be from PageRank when its visits start being counted
+BURN_IN_ERROR = 1e-3
+
+# Residual below which forward push leaves a page alone
+PUSH_THRESHOLD = 1e-6
+
+# Links per block when multiplying a matrix of rank vectors, small
+# enough that each block's products stay in cache
+MATRIX_BLOCK = 1 << 12
+
+# Power iterations between extrapolation steps
+EXTRAPOLATE_EVERY = 10
+
+# Pages updated together in each block of a Gauss-Seidel sweep
+SWEEP_BLOCK = 1 << 10
+
+
+class LinkGraph():
+
+    def __init__(self, pages, sources, targets):
+        """
+        Initialize a link graph over `pages` from parallel arrays of
+        link `sources` and `targets` (page indices, no duplicate links).
+
+        The column-stochastic transition matrix is stored in CSR form by
+        destination: the links into page `i` come from
+        `indices[indptr[i]:indptr[i + 1]]`, each weighted in `data` by
+        one over its source's out-degree. Pages without links
+        ("dangling" pages) are treated as linking to every page.
+        """
+        self.pages = list(pages)
+        self.n = len(self.pages)
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+
+        self.out_degree = np.bincount(sources, minlength=self.n)
+        self.dangling = self.out_degree == 0
+
+        order = np.argsort(targets, kind="stable")
+        self.indices = sources[order].astype(np.int32 if self.n < 2 ** 31 else np.int64)
+        self.indptr = np.zeros(self.n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(targets, minlength=self.n), out=self.indptr[1:])
+        self.data = 1.0 / self.out_degree[self.indices]
+        self.out_indptr = None
+        self.out_links = None
+        self.blocks = None
+
+    @classmethod
+    def from_corpus(cls, corpus):
+        """
+        LinkGraph.from_corpus(corpus) builds the graph for a corpus as
+        returned by `crawl`, with pages in sorted order.
+        """
+        pages = sorted(corpus)
+        index = {page: i for i, page in enumerate(pages)}
+        sources = []
+        targets = []
+        for page, links in corpus.items():
+            for link in links:
+                if link in index and link != page:
+                    sources.append(index[page])
+                    targets.append(index[link])
+        return cls(pages, sources, targets)
+
+    def matvec(self, ranks):
+        """
+        Return the rank each page receives through links when every page
+        splits `ranks` evenly over its outgoing links. `ranks` may be a
+        vector or a matrix with one column per rank vector.
+
+        A matrix is multiplied MATRIX_BLOCK links at a time, since the
+        products for every link and column at once would not fit in
+        cache.
+        """
+        if ranks.ndim == 1:
+            return segment_sum(self.data * ranks[self.indices], self.indptr)
+        if self.blocks is None:
+            starts = np.searchsorted(self.indptr, np.arange(0, self.indptr[-1], MATRIX_BLOCK))
+            self.blocks = np.unique(np.concatenate([[0], starts, [self.n]]))
+        result = np.empty((self.n,) + ranks.shape[1:])
+        for first, last in zip(self.blocks[:-1], self.blocks[1:]):
+            low = self.indptr[first]
+            high = self.indptr[last]
+            contributions = self.data[low:high, None] * ranks[self.indices[low:high]]
+            result[first:last] = segment_sum(contributions, self.indptr[first:last + 1] - low)
+        return result
+
+    def power_iteration(self, damping_factor, tolerance=TOLERANCE,
+                        max_iterations=MAX_ITERATIONS, start=None, teleport=None,
+                        callback=None, extrapolation=None):
+        """
+        Return (ranks, iterations): the PageRank vector found by power
+        iteration, and the number of iterations taken.
+
+        Each step computes
+            d * (M r + dangling mass / N) + (1 - d) / N
+        and iteration stops once the L1 norm of the change is at most
+        `tolerance`. `start` optionally warm-starts the iteration.
+
+        `teleport`, if given, replaces the uniform jump with a teleport
+        distribution (personalized PageRank), which dangling pages then
+        jump to as well. A matrix with one distribution per column is
+        solved for all columns at once, sharing each traversal of the
+        links; the ranks then have one column per distribution.
+
+        `callback`, if given, is called after every iteration with a
+        dictionary of its "iteration" number, L1 "residual", cumulative
+        "seconds", and whether its iterate was "extrapolated". An
+        `extrapolation` may be "aitken" or
+        "quadratic" to replace every EXTRAPOLATE_EVERY-th iterate of a
+        single rank vector by an extrapolation of the last few; it is
+        abandoned if the next change is larger than before it.
+        """
+        if self.n == 0:
+            return np.zeros((0,) + np.shape(teleport)[1:]), 0
+        if teleport is not None:
+            teleport = np.asarray(teleport, dtype=float)
+            teleport = teleport / teleport.sum(axis=0)
+        if extrapolation not in (None, "aitken", "quadratic"):
+            raise Exception(f"Unknown extrapolation: {extrapolation}")
+        if extrapolation and teleport is not None and teleport.ndim > 1:
+            raise Exception("Extrapolation needs a single rank vector")
+        if start is not None:
+            ranks = np.asarray(start, dtype=float)
+        elif teleport is not None:
+            ranks = teleport.copy()
+        else:
+            ranks = np.full(self.n, 1 / self.n)
+
+        started = time.perf_counter()
+        history = []
+        before = None
+        for iteration in range(1, max_iterations + 1):
+            new_ranks = self.step(ranks, damping_factor, teleport)
+            change = np.abs(new_ranks - ranks).sum(axis=0).max()
+
+            # An extrapolation that left the iterates worse is not retried
+            if before is not None and change > before:
+                extrapolation = None
+            before = None
+
+            history = history[-3:] + [ranks]
+            ranks = new_ranks
+            extrapolated = False
+            if extrapolation and iteration % EXTRAPOLATE_EVERY == 0 and change > tolerance:
+                if extrapolation == "aitken":
+                    ranks = aitken(history[-2], history[-1], ranks)
+                else:
+                    ranks = quadratic_extrapolation(history[-3], history[-2], history[-1], ranks)
+                extrapolated = True
+                before = change
+            if callback is not None:
+                callback({
+                    "iteration": iteration,
+                    "residual": float(change),
+                    "seconds": time.perf_counter() - started,
+                    "extrapolated": extrapolated
+                })
+            if change <= tolerance:
+                break
+        return ranks / ranks.sum(axis=0), iteration
+
+    def gauss_seidel(self, damping_factor, tolerance=TOLERANCE,
+                     max_iterations=MAX_ITERATIONS, callback=None):
+        """
+        Return (ranks, sweeps): PageRank found by block Gauss-Seidel
+        sweeps, and the number of sweeps taken.
+
+        Pages are updated SWEEP_BLOCK at a time in place, so each block
+        already uses the new ranks of the blocks before it. In-place
+        updates do not conserve total rank, so the teleport term is
+        taken from the current total, as is the dangling mass, and each
+        sweep ends by normalizing. Stopping and `callback` work as in
+        `power_iteration`, with sweeps counted as iterations.
+        """
+        if self.n == 0:
+            return np.zeros(0), 0
+        ranks = np.full(self.n, 1 / self.n)
+        bounds = list(range(0, self.n, SWEEP_BLOCK)) + [self.n]
+
+        started = time.perf_counter()
+        for sweep in range(1, max_iterations + 1):
+            previous = ranks.copy()
+            total = 1.0
+            dangling_mass = ranks[self.dangling].sum()
+            for first, last in zip(bounds[:-1], bounds[1:]):
+                low = self.indptr[first]
+                high = self.indptr[last]
+                received = segment_sum(
+                    self.data[low:high] * ranks[self.indices[low:high]],
+                    self.indptr[first:last + 1] - low
+                )
+                jump = ((1 - damping_factor) * total + damping_factor * dangling_mass) / self.n
+                block = damping_factor * received + jump
+                dangling = self.dangling[first:last]
+                dangling_mass += block[dangling].sum() - ranks[first:last][dangling].sum()
+                total += block.sum() - ranks[first:last].sum()
+                ranks[first:last] = block
+            ranks /= ranks.sum()
+            change = np.abs(ranks - previous).sum()
+            if callback is not None:
+                callback({
+                    "iteration": sweep,
+                    "residual": float(change),
+                    "seconds": time.perf_counter() - started,
+                    "extrapolated": False
+                })
+            if change <= tolerance:
+                break
+        return ranks, sweep
+
+    def top_k(self, damping_factor, k, ordered=True, tolerance=TOLERANCE,
+              max_iterations=MAX_ITERATIONS):
+        """
+        Return (best, ranks, iterations): the indices of the `k` highest
+        ranked pages, best first, with the ranks and iterations of the
+        power iteration that found them.
+
+        A power step shrinks the L1 error by `damping_factor`, so after
+        a step that changed the ranks by `change` in L1 norm the error
+        left is at most d * change / (1 - d). The errors of any two
+        pages add up to no more than that, so a page whose rank exceeds
+        another's by more than the bound is certain to rank above it.
+        Iteration stops as soon as the k-th page is certain to rank
+        above the rest and, if `ordered`, each of the top `k` above the
+        next; or, failing that (as with tied pages), at `tolerance`.
+        """
+        k = min(k, self.n)
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.full(self.n, 1 / max(self.n, 1)), 0
+        ranks = np.full(self.n, 1 / self.n)
+        for iteration in range(1, max_iterations + 1):
+            new_ranks = self.step(ranks, damping_factor)
+            change = np.abs(new_ranks - ranks).sum()
+            ranks = new_ranks
+            bound = damping_factor * change / (1 - damping_factor)
+            if bound >= ranks.max() and change > tolerance and iteration < max_iterations:
+                continue
+
+            # The top k and the best page after them, best first
+            if k < self.n:
+                candidates = np.argpartition(-ranks, k)[:k + 1]
+            else:
+                candidates = np.arange(self.n)
+            best = candidates[np.argsort(-ranks[candidates], kind="stable")]
+            gaps = -np.diff(ranks[best])
+            separated = k == self.n or gaps[k - 1] > bound
+            if ordered:
+                separated = separated and (gaps[:k - 1] > bound).all()
+            if separated or change <= tolerance:
+                break
+        return best[:k], ranks / ranks.sum(), iteration
+
+    def step(self, ranks, damping_factor, teleport=None):
+        """
+        Return the rank vector (or matrix) after one power-iteration step
+        from `ranks`, jumping uniformly or to the `teleport` distributions.
+        """
+        dangling_mass = ranks[self.dangling].sum(axis=0)
+        jump = 1 - damping_factor + damping_factor * dangling_mass
+        if teleport is None:
+            return damping_factor * self.matvec(ranks) + jump / self.n
+        return damping_factor * self.matvec(ranks) + jump * teleport
+
+    def forward_push(self, source, damping_factor, threshold=PUSH_THRESHOLD):
+        """
+        Return approximate personalized PageRank for teleporting to page
+        `source`, by forward push until no residual exceeds `threshold`.
+
+        Work is proportional to the pages near `source` rather than to
+        the whole graph. The estimates are lower bounds that fall short
+        in total by the residual left unpushed, at most N * threshold
+        divided by 1 - `damping_factor`.
+        """
+        ranks = np.zeros(self.n)
+        residuals = np.zeros(self.n)
+        residuals[source] = 1 - damping_factor
+        self.push(ranks, residuals, damping_factor, [source], threshold, dangling_to=source)
+        return ranks
+
+    def outgoing(self):
+        """
+        Return (out_indptr, out_links): the links in CSR form by source,
+        so the links out of page `i` are
+        `out_links[out_indptr[i]:out_indptr[i + 1]]`. Built on first use.
+        """
+        if self.out_links is None:
+            targets = np.repeat(np.arange(self.n), np.diff(self.indptr))
+            order = np.argsort(self.indices, kind="stable")
+            self.out_links = targets[order].astype(self.indices.dtype)
+            self.out_indptr = np.zeros(self.n + 1, dtype=np.int64)
+            np.cumsum(self.out_degree, out=self.out_indptr[1:])
+        return self.out_indptr, self.out_links
+
+    def sample(self, damping_factor, n, walkers, seed=None):
+        """
+        Return visit frequencies of `n` samples drawn by `walkers`
+        random surfers moving in lockstep, each starting on a page
+        chosen uniformly at random.
+
+        Every step, each surfer follows one of its page's links with
+        probability `damping_factor`, and otherwise (or on a dangling
+        page) jumps to any page uniformly. Both choices are uniform, so a
+        step is a coin flip and one random index per surfer. `seed`
+        makes the samples reproducible.
+
+        A surfer's distribution after k steps is within damping_factor
+        ** k of PageRank, so each surfer first takes `burn_in` steps
+        without counting them: enough to bring that below BURN_IN_ERROR.
+        Then how many walkers share the samples changes only the
+        variance of the result, not its bias.
+        """
+        if self.n == 0 or n <= 0:
+            return np.zeros(self.n)
+        rng = np.random.default_rng(seed)
+        out_indptr, out_links = self.outgoing()
+        walkers = max(1, min(walkers, n))
+
+        def step(positions):
+            follow = rng.random(walkers) < damping_factor
+            follow &= ~self.dangling[positions]
+            here = positions[follow]
+            picks = out_indptr[here] + (rng.random(len(here)) * self.out_degree[here]).astype(np.int64)
+            positions[follow] = out_links[picks]
+            jump = ~follow
+            positions[jump] = rng.integers(self.n, size=np.count_nonzero(jump))
+
+        counts = np.zeros(self.n, dtype=np.int64)
+        buffer = np.empty(max(SAMPLE_BUFFER, walkers), dtype=np.int64)
+        filled = 0
+        positions = rng.integers(self.n, size=walkers)
+        for _ in range(burn_in(damping_factor)):
+            step(positions)
+        remaining = n
+        while remaining > 0:
+            taken = min(walkers, remaining)
+            if filled + taken > len(buffer):
+                counts += np.bincount(buffer[:filled], minlength=self.n)
+                filled = 0
+            buffer[filled:filled + taken] = positions[:taken]
+            filled += taken
+            remaining -= taken
+            step(positions)
+        counts += np.bincount(buffer[:filled], minlength=self.n)
+        return counts / n
+
+    def push(self, ranks, residuals, damping_factor, seeds, threshold, dangling_to=None):
+        """
+        Refine `ranks` in place by forward push from the pages `seeds`,
+        given the residual vector `residuals` (also updated in place).
+
+        Each round, every page whose residual exceeds `threshold` in
+        magnitude adds it to its rank and passes `damping_factor` times
+        it on, split evenly over its links. Only the neighbours of
+        pushed pages are rescanned, so work stays local to where the
+        residuals are. Residual pushed from dangling pages goes to page
+        `dangling_to` if given. Otherwise it would reach every page
+        equally and only rescale the result, so it is dropped; callers
+        normalize the ranks afterwards.
+
+        Return (touched, pushes): the pages whose rank or residual
+        changed, and the number of pushes made.
+        """
+        out_indptr, out_links = self.outgoing()
+        touched = [np.asarray(seeds, dtype=np.int64)]
+        pushes = 0
+        frontier = np.unique(touched[0])
+        while len(frontier):
+            frontier = frontier[np.abs(residuals[frontier]) > threshold]
+            if not len(frontier):
+                break
+            pushes += len(frontier)
+            pushed = residuals[frontier]
+            ranks[frontier] += pushed
+            residuals[frontier] = 0
+
+            degrees = self.out_degree[frontier]
+            linked = degrees > 0
+            starts = out_indptr[frontier[linked]]
+            counts = degrees[linked]
+            positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            targets, inverse = np.unique(out_links[positions], return_inverse=True)
+            shares = np.repeat(damping_factor * pushed[linked] / counts, counts)
+            residuals[targets] += np.bincount(inverse, weights=shares, minlength=len(targets))
+            if dangling_to is not None and not linked.all():
+                residuals[dangling_to] += damping_factor * pushed[~linked].sum()
+                targets = np.union1d(targets, [dangling_to])
+            touched.append(targets)
+            frontier = targets
+        return np.unique(np.concatenate(touched)), pushes
+
+    def to_dict(self, ranks):
+        """
+        Return a dictionary mapping each page name to its rank.
+        """
+        return {page: float(rank) for page, rank in zip(self.pages, ranks)}
+
+
+def burn_in(damping_factor, error=BURN_IN_ERROR):
+    """
+    Return the number of steps after which a random surfer's
+    distribution is within `error` of PageRank from any start: the
+    smallest k with damping_factor ** k <= error.
+    """
+    if damping_factor <= 0:
+        return 0
+    if damping_factor >= 1:
+        return MAX_ITERATIONS
+    return math.ceil(math.log(error) / math.log(damping_factor))
+
+
+def aitken(previous, current, following):
+    """
+    Return the componentwise Aitken delta-squared extrapolation of
+    three successive iterates, keeping the latest value wherever the
+    second difference vanishes or the extrapolation turns negative.
+    """
+    first = current - previous
+    second = following - 2 * current + previous
+    safe = np.abs(second) > 1e-15
+    extrapolated = following.copy()
+    extrapolated[safe] = following[safe] - (following[safe] - current[safe]) ** 2 / second[safe]
+    extrapolated = np.where(extrapolated >= 0, extrapolated, following)
+    return extrapolated / extrapolated.sum()
+
+
+def quadratic_extrapolation(x0, x1, x2, x3):
+    """
+    Return the quadratic extrapolation (Kamvar et al.) of four
+    successive iterates: fit the minimal polynomial of degree two to
+    their differences by least squares, and combine the last three
+    iterates with its coefficients.
+    """
+    y1 = x1 - x0
+    y2 = x2 - x0
+    y3 = x3 - x0
+    (gamma1, gamma2), *_ = np.linalg.lstsq(np.column_stack([y1, y2]), -y3, rcond=None)
+    gamma3 = 1.0
+    beta0 = gamma1 + gamma2 + gamma3
+    beta1 = gamma2 + gamma3
+    beta2 = gamma3
+    extrapolated = beta0 * x1 + beta1 * x2 + beta2 * x3
+    total = extrapolated.sum()
+    if not np.isfinite(total) or total <= 0:
+        return x3
+    return extrapolated / total
+
+
+def segment_sum(values, indptr):
+    """
+    Sum `values` along its first axis over the CSR segments given by
+    `indptr`, yielding zero for empty segments.
+    """
+    n = len(indptr) - 1
+    padded = np.concatenate([values, np.zeros((1,) + values.shape[1:])])
+    sums = np.add.reduceat(padded, indptr[:-1], axis=0) if n else padded[:0]
+    sums[indptr[:-1] == indptr[1:]] = 0
+    return sums
@@ -0,0 +1,157 @@
+import numpy as np
+
+import crawler
+from graph import LinkGraph, TOLERANCE
+
+# Bound on the L1 error of an incremental update. Pushing to full
+# power-iteration precision would spread every change to most pages
+INCREMENTAL_TOLERANCE = 1e-6
+
+# Incremental updates in a row before ranks are recomputed from scratch,
+# so approximations other than the carried residual cannot build up
+MAX_INCREMENTAL_UPDATES = 20
+
+
+def edges(graph):
+    """
+    Return (sources, targets): every link of `graph` as parallel arrays.
+    """
+    _, out_links = graph.outgoing()
+    return np.repeat(np.arange(graph.n), graph.out_degree), np.asarray(out_links, dtype=np.int64)
+
+
+def residuals(graph, previous, damping_factor):
+    """
+    Return (ranks, residuals, seeds) for warm-starting PageRank on
+    `graph` from the `previous` state saved by `save_state`.
+
+    `ranks` holds each page's previous rank (0 for new pages). Those
+    ranks satisfied the PageRank equations of the previous corpus, so
+    the residual of the new equations is only nonzero near pages whose
+    links changed: their old link targets lose the rank they passed on
+    and their new targets gain it. New pages also lack the teleport
+    term the old ranks included everywhere else. Terms that are equal
+    on every page only rescale the solution and are left out. The
+    residual the previous update left unpushed is carried over too.
+    `seeds` lists the pages whose residual was set.
+    """
+    index = {page: i for i, page in enumerate(graph.pages)}
+    old_ranks = previous["ranks"]
+    old_n = len(previous["pages"])
+    renumber = np.array([index.get(page, -1) for page in previous["pages"]], dtype=np.int64)
+    kept = renumber >= 0
+
+    ranks = np.zeros(graph.n)
+    ranks[renumber[kept]] = old_ranks[kept]
+
+    old_sources = previous["sources"].astype(np.int64)
+    old_targets = previous["targets"].astype(np.int64)
+    old_degree = np.bincount(old_sources, minlength=old_n)
+    sources, targets = edges(graph)
+
+    # Pages whose links differ, found by comparing link keys in new numbering
+    both = kept[old_sources] & kept[old_targets]
+    old_keys = renumber[old_sources[both]] * graph.n + renumber[old_targets[both]]
+    changed_keys = np.setxor1d(old_keys, sources * graph.n + targets)
+    changed = np.zeros(graph.n, dtype=bool)
+    changed[changed_keys // graph.n] = True
+    changed[renumber[old_sources[kept[old_sources] & ~kept[old_targets]]]] = True
+
+    # Old links out of changed or removed pages no longer carry rank
+    old_changed = ~kept
+    old_changed[kept] = changed[renumber[kept]]
+    lost = old_changed[old_sources] & kept[old_targets]
+    residual = np.zeros(graph.n)
+    residual -= np.bincount(
+        renumber[old_targets[lost]],
+        weights=damping_factor * old_ranks[old_sources[lost]] / old_degree[old_sources[lost]],
+        minlength=graph.n
+    )
+
+    # New links out of changed pages carry their rank instead
+    gained = changed[sources]
+    residual += np.bincount(
+        targets[gained],
+        weights=damping_factor * ranks[sources[gained]] / graph.out_degree[sources[gained]],
+        minlength=graph.n
+    )
+
+    # New pages lack the teleport and dangling share every old page got
+    new = np.ones(graph.n, dtype=bool)
+    new[renumber[kept]] = False
+    dangling = old_ranks[old_degree == 0].sum()
+    residual[new] += (1 - damping_factor + damping_factor * dangling) / max(old_n, 1)
+
+    # Residual the previous update stopped short of pushing
+    residual[renumber[kept]] += previous["residual"][kept]
+    return ranks, residual, np.flatnonzero(residual)
+
+
+def save_state(directory, cache, graph, ranks, residual, updates, damping_factor):
+    """
+    Store the links, ranks and unpushed residual of this computation in
+    the crawl `cache`, with the number of incremental `updates` since
+    ranks were last computed from scratch, and write it back to
+    `directory` for the next incremental update.
+    """
+    sources, targets = edges(graph)
+    cache["pagerank"] = {
+        "damping_factor": damping_factor,
+        "pages": graph.pages,
+        "ranks": ranks,
+        "residual": residual,
+        "updates": updates,
+        "sources": sources.astype(graph.indices.dtype),
+        "targets": targets.astype(graph.indices.dtype)
+    }
+    crawler.save_cache(directory, cache)
+
+
+def update(directory, corpus, damping_factor, tolerance=INCREMENTAL_TOLERANCE):
+    """
+    Return (ranks, stats): PageRank for `corpus`, crawled from
+    `directory`, updated from the ranks saved with the crawl cache.
+
+    Residuals start at the pages whose links changed, plus whatever the
+    previous update left unpushed, and are spread by forward push with
+    a shrinking threshold until their total bounds the L1 error of the
+    ranks by `tolerance`. What is left is saved with the ranks and
+    seeds the next update, so errors do not build up across updates.
+    Without a saved state for the same damping factor, or after
+    MAX_INCREMENTAL_UPDATES incremental updates in a row, ranks are
+    computed from scratch by power iteration.
+
+    `stats` reports the mode, the pages touched and the page count,
+    with the pushes made by an incremental update or the iterations of
+    a full one, each of which sweeps every page.
+    """
+    graph = LinkGraph.from_corpus(corpus)
+    cache = crawler.load_cache(directory)
+    previous = cache.get("pagerank")
+    if (previous is None or previous["damping_factor"] != damping_factor
+            or "residual" not in previous
+            or previous["updates"] >= MAX_INCREMENTAL_UPDATES or graph.n == 0):
+        ranks, iterations = graph.power_iteration(damping_factor, TOLERANCE)
+        residual = np.zeros(graph.n)
+        updates = 0
+        stats = {"mode": "full", "pages": graph.n, "touched": graph.n,
+                 "iterations": iterations}
+    else:
+        ranks, residual, touched = residuals(graph, previous, damping_factor)
+        pushes = 0
+        threshold = np.abs(residual[touched]).max() if len(touched) else 0
+        floor = tolerance / max(graph.n, 1) * (1 - damping_factor)
+        while (np.abs(residual[touched]).sum() > tolerance * (1 - damping_factor)
+               and threshold > floor):
+            threshold /= 10
+            touched, round_pushes = graph.push(ranks, residual, damping_factor, touched, threshold)
+            pushes += round_pushes
+        total = ranks.sum()
+        if total > 0:
+            ranks /= total
+            residual /= total
+        updates = previous["updates"] + 1
+        stats = {"mode": "incremental", "pages": graph.n, "touched": len(touched),
+                 "pushes": pushes}
+    save_state(directory, cache, graph, ranks, residual, updates, damping_factor)
+    return graph.to_dict(ranks), stats
@@ -1,52 +1,140 @@
-import os
-import random
-import re
+import argparse
+import heapq
+import json
 import sys
-from copy import deepcopy
+
+import numpy as np
+
+import crawler
+import incremental
+import partitioned
+from graph import LinkGraph
 
 DAMPING = 0.85
 SAMPLES = 10000
 
+# Ways iterate_pagerank can speed up convergence
+METHODS = ["power", "aitken", "quadratic", "gauss-seidel"]
+
+# Random surfers sampled side by side. More walkers run faster, but each
+# one takes its own uncounted burn-in steps first
+WALKERS = 100
+
 
 def main():
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python pagerank.py corpus")
-    corpus = crawl(sys.argv[1])
-    ranks = sample_pagerank(corpus, DAMPING, SAMPLES)
-    print(f"PageRank Results from Sampling (n = {SAMPLES})")
-    for page in sorted(ranks):
-        print(f"  {page}: {ranks[page]:.4f}")
-    ranks = iterate_pagerank(corpus, DAMPING)
+    parser = argparse.ArgumentParser(description="Compute PageRank for a corpus.")
+    parser.add_argument("corpus")
+    parser.add_argument("--samples", type=int, default=SAMPLES)
+    parser.add_argument(
+        "--walkers", type=int, default=WALKERS,
+        help="random surfers sampled in parallel"
+    )
+    parser.add_argument("--seed", type=int, help="seed for reproducible sampling")
+    parser.add_argument("--workers", type=int, help="processes parsing pages (default: CPUs)")
+    parser.add_argument(
+        "--no-cache", action="store_true", help="ignore and do not write the link cache"
+    )
+    parser.add_argument(
+        "--timing", action="store_true", help="report crawl phase timings to stderr"
+    )
+    parser.add_argument(
+        "--related", metavar="PAGE",
+        help="also list the pages most related to PAGE by personalized PageRank"
+    )
+    parser.add_argument(
+        "--shards", type=int, default=1,
+        help="worker processes that each iterate one shard of the pages"
+    )
+    parser.add_argument(
+        "--method", choices=METHODS, default="power",
+        help="extrapolate power iteration, or sweep by Gauss-Seidel instead"
+    )
+    parser.add_argument(
+        "--trace", metavar="FILE",
+        help="write the residual and time of every iteration to FILE as JSON"
+    )
+    parser.add_argument(
+        "--top", type=int, metavar="K",
+        help="only print the K highest ranked pages, stopping iteration once they are certain"
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="update the ranks saved with the link cache instead of iterating from scratch"
+    )
+    args = parser.parse_args()
+    if args.incremental and args.no_cache:
+        parser.error("--incremental updates the ranks saved with the cache; drop --no-cache")
+    corpus = crawl(
+        args.corpus, workers=args.workers, cache=not args.no_cache,
+        out=sys.stderr if args.timing else None
+    )
+    ranks = sample_pagerank(corpus, DAMPING, args.samples, args.walkers, args.seed)
+    print(f"PageRank Results from Sampling (n = {args.samples})")
+    print_ranks(ranks, args.top)
+    if args.incremental:
+        ranks, stats = incremental.update(args.corpus, corpus, DAMPING)
+        if stats["mode"] == "incremental":
+            print(
+                f"Incremental update touched {stats['touched']} of {stats['pages']} "
+                f"pages with {stats['pushes']} pushes; a full recompute sweeps all "
+                f"{stats['pages']} pages every iteration",
+                file=sys.stderr
+            )
+        else:
+            print(
+                f"Full recompute swept all {stats['pages']} pages "
+                f"{stats['iterations']} times",
+                file=sys.stderr
+            )
+    elif args.top and args.shards == 1 and args.method == "power" and not args.trace:
+        ranks = dict(top_pagerank(corpus, DAMPING, args.top))
+    else:
+        trace = []
+        ranks = iterate_pagerank(
+            corpus, DAMPING, args.shards, method=args.method,
+            callback=trace.append if args.trace else None
+        )
+        if args.trace:
+            with open(args.trace, "w") as f:
+                json.dump(trace, f, indent=1)
+            print(
+                f"{args.method} converged in {len(trace)} iterations, "
+                f"{trace[-1]['seconds']:.3f}s" if trace else "No iterations",
+                file=sys.stderr
+            )
     print(f"PageRank Results from Iteration")
-    for page in sorted(ranks):
+    print_ranks(ranks, args.top)
+    if args.related:
+        if args.related not in corpus:
+            sys.exit(f"Page not in corpus: {args.related}")
+        print(f"Pages Related to {args.related}")
+        for page, score in related_pages(corpus, args.related, DAMPING):
+            print(f"  {page}: {score:.4f}")
+
+
+def print_ranks(ranks, top=None):
+    """
+    Print the pages of `ranks` by name, or only the `top` highest
+    ranked pages, best first, picked with a heap.
+    """
+    if top:
+        pages = [page for page, _ in heapq.nlargest(top, ranks.items(), key=lambda item: item[1])]
+    else:
+        pages = sorted(ranks)
+    for page in pages:
         print(f"  {page}: {ranks[page]:.4f}")
 
 
-def crawl(directory):
+def crawl(directory, workers=None, cache=True, out=None):
     """
     Parse a directory of HTML pages and check for links to other pages.
     Return a dictionary where each key is a page, and values are
     a list of all other pages in the corpus that are linked to by the page.
-    """
-    pages = dict()
-
-    # Extract all links from HTML files
-    for filename in os.listdir(directory):
-        if not filename.endswith(".html"):
-            continue
-        with open(os.path.join(directory, filename)) as f:
-            contents = f.read()
-            links = re.findall(r"<a\s+(?:[^>]*?)href=\"([^\"]*)\"", contents)
-            pages[filename] = set(links) - {filename}
-
-    # Only include links to other pages in the corpus
-    for filename in pages:
-        pages[filename] = set(
-            link for link in pages[filename]
-            if link in pages
-        )
 
-    return pages
+    Unchanged pages are read from a link cache kept in `directory`, and
+    the rest are parsed by `workers` processes; see `crawler.crawl`.
+    """
+    return crawler.crawl(directory, workers=workers, cache=cache, out=out)
 
 
 def transition_model(corpus, page, damping_factor):
@@ -72,49 +160,119 @@ def transition_model(corpus, page, damping_factor):
             prob_dis[all_pages]= for_all_pages
     return prob_dis
 
-def sample_pagerank(corpus, damping_factor, n):
+def sample_pagerank(corpus, damping_factor, n, walkers=WALKERS, seed=None):
     """
     Return PageRank values for each page by sampling `n` pages
     according to transition model, starting with a page at random.
 
+    The samples are shared among `walkers` random surfers that step
+    together as NumPy arrays, each starting on a random page and
+    burning in before its visits count; `seed` makes the result
+    reproducible.
+
     Return a dictionary where keys are page names, and values are
     their estimated PageRank value (a value between 0 and 1). All
     PageRank values should sum to 1.
     """
-    final_dict={k:0 for k, i in corpus.items()}
-    ran_page = random.choice(list(corpus.keys()))
-    sample_dict = transition_model(corpus,ran_page,damping_factor)
-    final_dict[ran_page]+=1
-    for o in range(n):
-        ran_page = random.choices(list(sample_dict.keys()),weights=list(sample_dict.values()))[0]
-        final_dict[ran_page]+=1
-        sample_dict = transition_model(corpus,ran_page,damping_factor)
-    final_dict = {k: i/n for k, i in final_dict.items()}
-    return final_dict
+    graph = LinkGraph.from_corpus(corpus)
+    return graph.to_dict(graph.sample(damping_factor, n, walkers, seed))
+
 
-def iterate_pagerank(corpus, damping_factor):
+def iterate_pagerank(corpus, damping_factor, shards=1, method="power", callback=None):
     """
     Return PageRank values for each page by iteratively updating
     PageRank values until convergence.
 
+    The corpus is compiled once into a sparse transition matrix and
+    solved by vectorized power iteration; pages without links count as
+    linking to every page. With several `shards`, the pages are split
+    among that many worker processes (see `partitioned`).
+
+    `method` is one of METHODS: plain power iteration, power iteration
+    with periodic Aitken or quadratic extrapolation, or Gauss-Seidel
+    sweeps. `callback` is called with a record of every iteration, as
+    described in `LinkGraph.power_iteration`.
+
     Return a dictionary where keys are page names, and values are
     their estimated PageRank value (a value between 0 and 1). All
     PageRank values should sum to 1.
     """
-    final_dict={k : 1/len(corpus.keys()) for k in list(corpus.keys())}
-    while True:
-        instance_dict = deepcopy(final_dict)
-        for key in list(corpus.keys()):
-            final_dict[key]= (1-damping_factor)/len(corpus.keys())
-            all_links = [li for li in list(corpus.keys()) if key in corpus[li]]
-            sum_all_links=0
-            if all_links:
-                for i in all_links:
-                    sum_all_links+=instance_dict[i] / len(corpus[i])
-            final_dict[key]+=damping_factor*sum_all_links
-        if abs(instance_dict[key] - final_dict[key]) <=0.001:
-            final_dict = {eys : ules/sum(final_dict.values()) for eys, ules in final_dict.items()}
-            return final_dict
+    if method not in METHODS:
+        raise Exception(f"Unknown method: {method}")
+    if shards > 1 and (method != "power" or callback is not None):
+        raise Exception("Sharded iteration only supports plain power iteration")
+    graph = LinkGraph.from_corpus(corpus)
+    if shards > 1:
+        ranks, _ = partitioned.partitioned_pagerank(graph, damping_factor, shards)
+    elif method == "gauss-seidel":
+        ranks, _ = graph.gauss_seidel(damping_factor, callback=callback)
+    else:
+        extrapolation = None if method == "power" else method
+        ranks, _ = graph.power_iteration(
+            damping_factor, callback=callback, extrapolation=extrapolation
+        )
+    return graph.to_dict(ranks)
+
+
+def top_pagerank(corpus, damping_factor, k, ordered=True):
+    """
+    Return the `k` highest ranked pages of `corpus` as a list of
+    (page, rank) pairs, best first.
+
+    Power iteration stops as soon as its error bound shows no other
+    page can enter the top `k` (nor, if `ordered`, change their order),
+    which is often long before the ranks themselves converge; see
+    `LinkGraph.top_k`. The ranks returned are those estimates.
+    """
+    graph = LinkGraph.from_corpus(corpus)
+    best, ranks, _ = graph.top_k(damping_factor, k, ordered)
+    return [(graph.pages[i], float(ranks[i])) for i in best]
+
+
+def personalized_pagerank(corpus, damping_factor, seeds):
+    """
+    Return a list of PageRank dictionaries, one per entry of `seeds`,
+    where the random surfer teleports to that entry's pages instead of
+    to any page.
+
+    Each entry is a page, a collection of pages teleported to evenly
+    (for topic-sensitive PageRank), or a dictionary mapping pages to
+    teleport weights. All entries are solved together, with one
+    traversal of the links per iteration for the whole batch.
+    """
+    graph = LinkGraph.from_corpus(corpus)
+    index = {page: i for i, page in enumerate(graph.pages)}
+    teleport = np.zeros((graph.n, len(seeds)))
+    for column, seed in enumerate(seeds):
+        if isinstance(seed, str):
+            seed = {seed: 1}
+        elif not isinstance(seed, dict):
+            seed = {page: 1 for page in seed}
+        if not seed:
+            raise Exception("Seed with no pages")
+        for page, weight in seed.items():
+            teleport[index[page], column] = weight
+    ranks, _ = graph.power_iteration(damping_factor, teleport=teleport)
+    return [graph.to_dict(ranks[:, column]) for column in range(len(seeds))]
+
+
+def related_pages(corpus, page, damping_factor, limit=10, graph=None):
+    """
+    Return up to `limit` (page, score) pairs for the pages most related
+    to `page`, best first, scored by approximate personalized PageRank
+    for teleporting to `page` and computed by forward push.
+
+    `graph`, a LinkGraph already built from `corpus`, can be passed to
+    skip rebuilding it for repeated lookups.
+    """
+    graph = graph or LinkGraph.from_corpus(corpus)
+    source = graph.pages.index(page)
+    ranks = graph.forward_push(source, damping_factor)
+    ranks[source] = 0
+    found = np.flatnonzero(ranks)
+    best = found[np.argsort(-ranks[found], kind="stable")[:limit]]
+    return [(graph.pages[i], float(ranks[i])) for i in best]
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,222 @@
+import argparse
+import multiprocessing
+import os
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from graph import LinkGraph, MAX_ITERATIONS, TOLERANCE, segment_sum
+
+# Seconds a worker waits at a barrier before giving up on the others
+BARRIER_TIMEOUT = 600
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Scaling benchmark for partitioned multi-process PageRank."
+    )
+    parser.add_argument("--pages", type=int, default=1000000)
+    parser.add_argument("--links", type=int, default=10000000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--damping", type=float, default=0.85)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    benchmark(args.pages, args.links, args.workers, args.damping, args.seed)
+
+
+class SharedArrays():
+
+    def __init__(self, arrays):
+        """
+        Copy each named array in `arrays` into its own block of shared
+        memory, so worker processes can map it without copying.
+        """
+        self.blocks = {}
+        self.specs = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+            self.blocks[name] = block
+            self.specs[name] = (block.name, array.shape, array.dtype.str)
+
+    def view(self, name):
+        block = self.blocks[name]
+        _, shape, dtype = self.specs[name]
+        return np.ndarray(shape, dtype, buffer=block.buf)
+
+    def close(self):
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+
+
+def attach(specs):
+    """
+    Map the shared arrays described by `specs` in a worker, returning
+    (arrays, blocks); the blocks must stay open while arrays are used.
+    """
+    arrays = {}
+    blocks = []
+    for name, (block_name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype, buffer=block.buf)
+    return arrays, blocks
+
+
+def shards(graph, workers):
+    """
+    Return the page boundaries splitting `graph` into `workers`
+    contiguous shards holding similar numbers of incoming links.
+    """
+    targets = np.linspace(0, graph.indptr[-1] + graph.n, workers + 1)
+    weights = graph.indptr + np.arange(graph.n + 1)
+    bounds = np.searchsorted(weights, targets)
+    bounds[0] = 0
+    bounds[-1] = graph.n
+    return np.maximum.accumulate(bounds)
+
+
+def work(shard, first, last, specs, barrier, damping_factor, tolerance, max_iterations):
+    """
+    Attach to the shared graph and run worker `shard` over pages `first`
+    to `last`, breaking the barrier for the others if it fails.
+    """
+    arrays, blocks = attach(specs)
+    try:
+        iterate(shard, first, last, arrays, barrier, damping_factor, tolerance, max_iterations)
+    except Exception:
+        barrier.abort()
+        raise
+    finally:
+        arrays = None
+        for block in blocks:
+            try:
+                block.close()
+            except BufferError:
+                pass
+
+
+def iterate(shard, first, last, arrays, barrier, damping_factor, tolerance, max_iterations):
+    """
+    Run PageRank iterations for pages `first` to `last` as worker `shard`.
+
+    Every iteration, each worker sums the dangling rank of its pages
+    into `partials`, waits for the others, and computes its pages' next
+    ranks from the shared rank vector, which is how contributions from
+    other shards cross the boundary. It then posts its share of the L1
+    change and waits again, so all workers see the same total and stop
+    together. Both rank buffers live in shared memory and swap roles
+    each iteration.
+    """
+    n = len(arrays["dangling"])
+    indptr = arrays["indptr"]
+    low = indptr[first]
+    high = indptr[last]
+    indices = arrays["indices"][low:high]
+    data = arrays["data"][low:high]
+    local_indptr = indptr[first:last + 1] - low
+    dangling = arrays["dangling"][first:last]
+    buffers = [arrays["ranks"], arrays["next"]]
+    partials = arrays["partials"]
+    changes = arrays["changes"]
+
+    for iteration in range(1, max_iterations + 1):
+        ranks, following = buffers
+        partials[shard] = ranks[first:last][dangling].sum()
+        barrier.wait(BARRIER_TIMEOUT)
+
+        teleport = (1 - damping_factor + damping_factor * partials.sum()) / n
+        following[first:last] = damping_factor * segment_sum(data * ranks[indices], local_indptr) + teleport
+        changes[shard] = np.abs(following[first:last] - ranks[first:last]).sum()
+        barrier.wait(BARRIER_TIMEOUT)
+
+        buffers.reverse()
+        if changes.sum() <= tolerance:
+            break
+    arrays["iterations"][shard] = iteration
+
+
+def partitioned_pagerank(graph, damping_factor, workers, tolerance=TOLERANCE,
+                         max_iterations=MAX_ITERATIONS):
+    """
+    Return (ranks, iterations) like `LinkGraph.power_iteration`, with
+    the pages split into `workers` shards each iterated by its own
+    process.
+
+    The link arrays and both rank vectors are placed in shared memory
+    once; the processes are a local stand-in for cluster nodes, and
+    only synchronize at two barriers per iteration.
+    """
+    if graph.n == 0:
+        return np.zeros(0), 0
+    workers = max(1, min(workers, graph.n))
+    shared = SharedArrays({
+        "indptr": graph.indptr,
+        "indices": graph.indices,
+        "data": graph.data,
+        "dangling": graph.dangling,
+        "ranks": np.full(graph.n, 1 / graph.n),
+        "next": np.zeros(graph.n),
+        "partials": np.zeros(workers),
+        "changes": np.zeros(workers),
+        "iterations": np.zeros(workers, dtype=np.int64)
+    })
+    try:
+        bounds = shards(graph, workers)
+        barrier = multiprocessing.Barrier(workers)
+        processes = [
+            multiprocessing.Process(
+                target=work,
+                args=(shard, bounds[shard], bounds[shard + 1], shared.specs, barrier,
+                      damping_factor, tolerance, max_iterations)
+            )
+            for shard in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        if any(process.exitcode != 0 for process in processes):
+            raise Exception("A PageRank worker failed")
+
+        iterations = int(shared.view("iterations")[0])
+        ranks = shared.view("next" if iterations % 2 else "ranks").copy()
+    finally:
+        shared.close()
+    return ranks / ranks.sum(), iterations
+
+
+def benchmark(pages, links, workers, damping_factor, seed):
+    """
+    Time partitioned PageRank on a random graph for each worker count
+    in `workers`, checking every result against the single-process
+    engine, and print the speedups.
+    """
+    rng = np.random.default_rng(seed)
+    sources = rng.integers(pages, size=links)
+    targets = rng.integers(pages, size=links)
+    keep = sources != targets
+    pairs = np.unique(np.stack([sources[keep], targets[keep]], axis=1), axis=0)
+    graph = LinkGraph(range(pages), pairs[:, 0], pairs[:, 1])
+    print(f"{pages} pages, {len(pairs)} links, {os.cpu_count()} CPUs")
+
+    start = time.perf_counter()
+    expected, iterations = graph.power_iteration(damping_factor)
+    print(f"single process: {time.perf_counter() - start:.2f}s, {iterations} iterations")
+
+    print(f"{'workers':>8}{'seconds':>10}{'speedup':>10}{'L1 vs single':>14}")
+    baseline = None
+    for count in workers:
+        start = time.perf_counter()
+        ranks, _ = partitioned_pagerank(graph, damping_factor, count)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        difference = np.abs(ranks - expected).sum()
+        print(f"{count:>8}{elapsed:>10.2f}{baseline / elapsed:>10.2f}{difference:>14.1e}")
+
+
+if __name__ == "__main__":
+    main()